@@ -2,6 +2,8 @@ from django.contrib import admin
 from recipes.models import (Tag, Ingredient, Recipe, IngredientRecipe,
                             FavoriteRecipe, ShoppingCartRecipes)
 from users.models import FoodUser, Subscription
+from api.images import schedule_image_variants
+from api.search import update_search_vector
 
 
 class IngredientRecipeInline(admin.TabularInline):
@@ -36,9 +38,15 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('name', 'author', 'tags')
     inlines = (IngredientRecipeInline,)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vector(form.instance)
+        if 'image' in form.changed_data:
+            schedule_image_variants(form.instance)
+
     @admin.display(description='Число добавлений в избранное')
     def in_favorites(self, obj):
-        return obj.recipe_in_favorite.count()
+        return obj.favorites_count
 
 
 @admin.register(FoodUser)
@@ -0,0 +1,268 @@
+from asgiref.sync import sync_to_async
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from recipes.models import Ingredient, Recipe
+from users.models import Subscription
+
+from .authentication import StatelessTokenAuthentication
+from .conditional import aviewer_state, make_etag, recipes_version
+from .ingredient_index import ingredient_index
+from .paginators import FoodPageLimitPaginator
+from .serializers import RecipeReadSerializer
+from .shopping_list import (SHOPPING_LIST_FORMATS, ashopping_list_etag,
+                            ashopping_list_rows)
+from .tag_cache import tag_cache
+from .views import (DownloadShoppingCartView, IngredientViewSet,
+                    RecipeViewSet, TagViewSet, filter_recipes)
+
+
+def json_response(data, allow, status=200, headers=None):
+    """
+    JSON-ответ с теми же телом и заголовками, что отдает DRF.
+    """
+    response = HttpResponse(JSONRenderer().render(data), status=status,
+                            content_type='application/json',
+                            headers=headers)
+    response['Allow'] = allow
+    response['Vary'] = 'Accept'
+    return response
+
+
+async def authenticate(request):
+    """
+    Аутентификация классами из REST_FRAMEWORK. Подписанный токен
+    проверяется без базы в цикле событий, остальные заголовки
+    разбирают те же классы, что и в синхронных view, в потоке.
+    """
+    result = StatelessTokenAuthentication().authenticate(request)
+    if result is not None:
+        return result[0]
+
+    drf_request = Request(request, authenticators=[
+        authenticator() for authenticator
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    return await sync_to_async(lambda: drf_request.user)()
+
+
+def async_read_view(sync_view, fallback=None):
+    """
+    Асинхронный обработчик GET-запросов. Остальные методы, запросы,
+    для которых fallback(request) истинно, и ошибки передаются
+    синхронному view DRF, чтобы ответы совпадали с ответами DRF.
+    """
+    sync_view = sync_to_async(sync_view)
+
+    def delegate(request, kwargs):
+        # Роутер DRF передает в view строковые pk.
+        return sync_view(request, **{key: str(value)
+                                     for key, value in kwargs.items()})
+
+    def decorator(handler):
+        async def view(request, **kwargs):
+            if request.method not in ('GET', 'HEAD') or (
+                    fallback is not None and fallback(request)):
+                return await delegate(request, kwargs)
+            try:
+                request.user = await authenticate(request)
+                return await handler(request, **kwargs)
+            except exceptions.APIException:
+                return await delegate(request, kwargs)
+
+        view.csrf_exempt = True
+        return view
+    return decorator
+
+
+def render_recipes(recipes, request):
+    return RecipeReadSerializer(
+        recipes, many=True, context={'request': request}).data
+
+
+async def prefetch_subscriptions(request):
+    """
+    Кеширует на запросе id авторов из подписок пользователя, чтобы
+    сериализатор не обращался за ними к базе.
+    """
+    if request.user.is_authenticated:
+        request._subscribed_ids = frozenset([
+            pk async for pk in Subscription.objects.filter(
+                user=request.user).values_list('subscription_id', flat=True)
+        ])
+
+
+async def paginate(queryset, request):
+    """
+    Страница FoodPageLimitPaginator: COUNT и строки страницы читаются
+    асинхронными запросами. Без limit пагинатор не используется.
+    """
+    paginator = FoodPageLimitPaginator()
+    paginator.cursor_paginator = None
+    drf_request = Request(request)
+    page_size = paginator.get_page_size(drf_request)
+    if not page_size:
+        return [recipe async for recipe in queryset], None
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(drf_request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        raise exceptions.NotFound(paginator.invalid_page_message.format(
+            page_number=page_number, message=str(exc)))
+    paginator.request = drf_request
+    return [recipe async for recipe in paginator.page.object_list], paginator
+
+
+RECIPE_LIST_ALLOW = 'GET, POST, HEAD, OPTIONS'
+RECIPE_DETAIL_ALLOW = 'GET, PUT, PATCH, DELETE, HEAD, OPTIONS'
+READ_ONLY_ALLOW = 'GET, HEAD, OPTIONS'
+
+
+@async_read_view(
+    RecipeViewSet.as_view({'get': 'list', 'post': 'create'},
+                          basename='recipe', detail=False),
+    fallback=lambda request: 'cursor' in request.GET)
+async def recipe_list(request):
+    """
+    Список рецептов. Курсорная пагинация обслуживается синхронным view.
+    """
+    etag = make_etag('recipes', request.get_full_path(),
+                     await sync_to_async(recipes_version)(),
+                     await sync_to_async(tag_cache.version)(),
+                     *await aviewer_state(request.user))
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    queryset = await sync_to_async(filter_recipes)(request.user, request.GET)
+    recipes, paginator = await paginate(queryset, request)
+    await prefetch_subscriptions(request)
+    results = await sync_to_async(render_recipes)(recipes, request)
+
+    data = results
+    if paginator is not None:
+        data = paginator.get_paginated_response(results).data
+    return json_response(data, RECIPE_LIST_ALLOW, headers={'ETag': etag})
+
+
+@async_read_view(
+    RecipeViewSet.as_view({'get': 'retrieve', 'put': 'update',
+                           'patch': 'partial_update', 'delete': 'destroy'},
+                          basename='recipe', detail=True))
+async def recipe_detail(request, pk):
+    modified = await Recipe.objects.filter(pk=pk).values_list(
+        'modified', flat=True).afirst()
+    if modified is None:
+        raise exceptions.NotFound
+
+    etag = make_etag('recipe', str(pk), modified,
+                     await sync_to_async(tag_cache.version)(),
+                     *await aviewer_state(request.user))
+    last_modified = None
+    if request.user.is_anonymous:
+        last_modified = int(modified.timestamp())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    queryset = await sync_to_async(filter_recipes)(request.user, request.GET)
+    recipe = await queryset.filter(pk=pk).afirst()
+    if recipe is None:
+        raise exceptions.NotFound
+    await prefetch_subscriptions(request)
+    data = (await sync_to_async(render_recipes)([recipe], request))[0]
+
+    headers = {'ETag': etag}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return json_response(data, RECIPE_DETAIL_ALLOW, headers=headers)
+
+
+@async_read_view(
+    IngredientViewSet.as_view({'get': 'list'}, basename='ingredient',
+                              detail=False))
+async def ingredient_list(request):
+    """
+    Список ингредиентов. Поиск по индексу выполняется в потоке:
+    устаревший или отсутствующий индекс строится запросом к базе.
+    """
+    name = request.GET.get('name')
+    if name:
+        return json_response(
+            await sync_to_async(ingredient_index.search)(name),
+            READ_ONLY_ALLOW)
+    return json_response(
+        [ingredient async for ingredient in Ingredient.objects.values(
+            'id', 'name', 'measurement_unit')],
+        READ_ONLY_ALLOW)
+
+
+@async_read_view(
+    IngredientViewSet.as_view({'get': 'retrieve'}, basename='ingredient',
+                              detail=True))
+async def ingredient_detail(request, pk):
+    ingredient = await Ingredient.objects.filter(pk=pk).values(
+        'id', 'name', 'measurement_unit').afirst()
+    if ingredient is None:
+        raise exceptions.NotFound
+    return json_response(ingredient, READ_ONLY_ALLOW)
+
+
+@async_read_view(
+    TagViewSet.as_view({'get': 'list'}, basename='tag', detail=False))
+async def tag_list(request):
+    etag = make_etag('tags', await sync_to_async(tag_cache.version)())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = json_response(await sync_to_async(tag_cache.all)(),
+                                 READ_ONLY_ALLOW, headers={'ETag': etag})
+    return response
+
+
+@async_read_view(
+    TagViewSet.as_view({'get': 'retrieve'}, basename='tag', detail=True))
+async def tag_detail(request, pk):
+    etag = make_etag('tag', str(pk), await sync_to_async(tag_cache.version)())
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    tag = await sync_to_async(tag_cache.get)(pk)
+    if tag is None:
+        raise exceptions.NotFound
+    return json_response(tag, READ_ONLY_ALLOW, headers={'ETag': etag})
+
+
+@async_read_view(
+    DownloadShoppingCartView.as_view(),
+    fallback=lambda request: request.GET.get(
+        'format', 'txt') not in SHOPPING_LIST_FORMATS)
+async def download_shopping_cart(request):
+    """
+    Выгрузка списка покупок. Строки читаются асинхронным итератором
+    порциями по CHUNK_SIZE и отдаются потоком по мере чтения.
+    """
+    if not request.user.is_authenticated:
+        raise exceptions.NotAuthenticated
+    list_format = request.GET.get('format', 'txt')
+    etag = await ashopping_list_etag(request.user, list_format)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    shopping_list_format = SHOPPING_LIST_FORMATS[list_format]
+    response = StreamingHttpResponse(
+        shopping_list_format.arender(ashopping_list_rows(request.user)),
+        content_type=shopping_list_format.content_type)
+    response['ETag'] = etag
+    response['Content-Disposition'] = (
+        f'attachment; filename="sh_list.{list_format}"')
+    return response
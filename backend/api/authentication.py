@@ -0,0 +1,66 @@
+from rest_framework import authentication, exceptions, permissions
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from users.models import FoodUser
+
+from .replicas import use_primary
+
+
+class StatelessTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Аутентификация по подписанному access-токену без запросов к базе.
+    Принимает заголовки "Token <jwt>" и "Bearer <jwt>". Токен без точек
+    считается старым токеном из базы и передается TokenAuthentication.
+    Для изменяющих запросов одним запросом проверяется, что пользователь
+    есть и активен.
+    """
+    keywords = (b'token', b'bearer')
+
+    def authenticate(self, request):
+        auth = authentication.get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() not in self.keywords:
+            return None
+        if auth[1].count(b'.') != 2:
+            return None
+
+        try:
+            token = AccessToken(auth[1].decode())
+        except (TokenError, UnicodeError):
+            raise exceptions.AuthenticationFailed(
+                'Недействительный или просроченный токен')
+        user_id = token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise exceptions.AuthenticationFailed(
+                'Токен не содержит пользователя')
+        if (request.method not in permissions.SAFE_METHODS
+                and not FoodUser.objects.filter(
+                    pk=user_id, is_active=True).exists()):
+            raise exceptions.AuthenticationFailed(
+                'Пользователь не найден или деактивирован')
+        return self.get_user(user_id), token
+
+    def get_user(self, user_id):
+        """
+        Пользователь с одним загруженным полем id. Остальные поля
+        загрузятся одним запросом при первом обращении к любому из них.
+        """
+        return FoodUser.from_db(None, ['id'], [user_id])
+
+    def authenticate_header(self, request):
+        return 'Token'
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """
+    Токен из базы. Только что выданный токен мог еще не дойти
+    до реплики, поэтому ненайденный токен ищется в основной базе.
+    """
+    def authenticate_credentials(self, key):
+        try:
+            return super().authenticate_credentials(key)
+        except exceptions.AuthenticationFailed:
+            if not use_primary():
+                raise
+            return super().authenticate_credentials(key)
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCartRecipes
+from users.models import FoodUser, Subscription
+
+from .counters import count_subquery
+from .feed import backfill_feed, remove_from_feed
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+
+
+def delete_rows(model, pks):
+    """
+    Удаляет строки model с первичными ключами pks одним DELETE.
+    Сигналы post_delete не отправляются: вызывающий код сам обновляет
+    то, что пересчитывали бы обработчики по одной строке.
+    """
+    if not pks:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(model._meta.pk.column)} IN '
+            f'({", ".join(["%s"] * len(pks))})',
+            list(pks))
+
+
+class BulkLinks:
+    """
+    Массовое добавление и удаление связей пользователя с рецептами
+    или авторами. Каждая операция выполняется в транзакции одной
+    вставкой или одним удалением. Ни вставка, ни удаление не отправляют
+    сигналы, поэтому счетчик затронутых объектов пересчитывается одним
+    запросом.
+    """
+    def __init__(self, model, field, target_model, counter=None):
+        self.model = model
+        self.field = field
+        self.target_model = target_model
+        self.counter = counter
+
+    def targets(self, user, ids):
+        return self.target_model.objects.filter(pk__in=ids)
+
+    def links(self, user, ids):
+        return self.model.objects.filter(
+            user=user, **{f'{self.field}__in': ids})
+
+    def add(self, user, ids):
+        with transaction.atomic():
+            found = set(self.targets(user, ids).values_list('pk', flat=True))
+            linked = set(self.links(user, found).values_list(
+                self.field, flat=True))
+            created = found - linked
+            self.model.objects.bulk_create(
+                [self.model(user=user, **{f'{self.field}_id': pk})
+                 for pk in created],
+                batch_size=1000, ignore_conflicts=True)
+            self.recount(created)
+            self.after_add(user, created)
+
+        return {pk: (CREATED if pk in created
+                     else EXISTS if pk in linked else NOT_FOUND)
+                for pk in ids}
+
+    def remove(self, user, ids):
+        with transaction.atomic():
+            links = dict(self.links(user, ids).values_list('pk', self.field))
+            removed = set(links.values())
+            delete_rows(self.model, links)
+            self.recount(removed)
+            self.after_remove(user, removed)
+
+        return {pk: DELETED if pk in removed else NOT_FOUND for pk in ids}
+
+    def recount(self, pks):
+        if self.counter is None or not pks:
+            return
+        self.target_model.objects.filter(pk__in=pks).update(
+            **{self.counter: count_subquery(self.model, self.field)})
+
+    def after_add(self, user, pks):
+        pass
+
+    def after_remove(self, user, pks):
+        pass
+
+
+class BulkSubscriptions(BulkLinks):
+    """
+    Массовая подписка: на себя подписаться нельзя, лента подписчика
+    дополняется рецептами новых авторов.
+    """
+    def targets(self, user, ids):
+        return super().targets(user, ids).exclude(pk=user.pk)
+
+    def after_add(self, user, pks):
+        if pks:
+            backfill_feed(user, *FoodUser.objects.filter(
+                pk__in=pks, followers_count__lte=settings.FEED_FANOUT_LIMIT
+            ).only('pk', 'followers_count'))
+
+    def after_remove(self, user, pks):
+        if pks:
+            remove_from_feed(user, *pks)
+
+
+favorites = BulkLinks(FavoriteRecipe, 'recipe', Recipe, 'favorites_count')
+shopping_cart = BulkLinks(ShoppingCartRecipes, 'recipe', Recipe)
+subscriptions = BulkSubscriptions(Subscription, 'subscription', FoodUser,
+                                  'followers_count')
@@ -0,0 +1,65 @@
+import hashlib
+
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.utils.cache import quote_etag
+
+from recipes.models import FavoriteRecipe, ShoppingCartRecipes
+from users.models import FoodUser, Subscription
+
+from .versions import get_version
+
+RECIPES_VERSION_KEY = 'recipes:version'
+
+
+def make_etag(*parts):
+    key = ':'.join(str(part) for part in parts)
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def recipes_version():
+    """
+    Версия выдачи рецептов целиком. Меняется при любом изменении
+    рецептов, их ингредиентов, тегов и авторов.
+    """
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def link_state(model):
+    """
+    Число и максимальный id строк связи пользователя. Пара меняется
+    при любой вставке или удалении, поэтому годится как валидатор.
+    """
+    links = (model.objects.filter(user=OuterRef('pk'))
+             .order_by().values('user'))
+    return (
+        Subquery(links.annotate(state=Count('pk')).values('state'),
+                 output_field=IntegerField()),
+        Subquery(links.annotate(state=Max('pk')).values('state'),
+                 output_field=IntegerField()),
+    )
+
+
+def viewer_state_query(user):
+    annotations = {}
+    for model in (FavoriteRecipe, ShoppingCartRecipes, Subscription):
+        count, last = link_state(model)
+        annotations[f'{model.__name__}_count'] = count
+        annotations[f'{model.__name__}_last'] = last
+    return FoodUser.objects.filter(pk=user.pk).annotate(
+        **annotations).values_list(*annotations)
+
+
+def viewer_state(user):
+    """
+    Состояние избранного, списка покупок и подписок пользователя,
+    от которого зависят его флаги в выдаче рецептов. Один запрос.
+    """
+    if user.is_anonymous:
+        return ()
+    return (user.pk,) + viewer_state_query(user).get()
+
+
+async def aviewer_state(user):
+    if user.is_anonymous:
+        return ()
+    return (user.pk,) + await viewer_state_query(user).aget()
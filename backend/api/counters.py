@@ -0,0 +1,26 @@
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    """
+    Подзапрос с числом строк model, ссылающихся на внешний объект
+    через поле field.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')})
+        .order_by().values(field).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def reconcile(model, counter, related_model, field):
+    """
+    Пересчитывает счетчик counter у расходящихся с данными объектов.
+    Возвращает число исправленных строк.
+    """
+    actual = count_subquery(related_model, field)
+    drifted = model.objects.alias(actual=actual).filter(
+        ~Q(**{counter: actual}))
+    return model.objects.filter(pk__in=drifted.values('pk')).update(
+        **{counter: actual})
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+
+from recipes.models import FeedRecipe, Recipe
+from users.models import FoodUser, Subscription
+
+
+def is_popular(author):
+    return author.followers_count > settings.FEED_FANOUT_LIMIT
+
+
+def fan_out_recipe(recipe):
+    """
+    Добавляет новый рецепт в ленты подписчиков автора. Рецепты
+    популярных авторов не раскладываются и подмешиваются при чтении.
+    """
+    if is_popular(recipe.author):
+        return
+    followers = Subscription.objects.filter(
+        subscription=recipe.author_id).values_list('user_id', flat=True)
+    FeedRecipe.objects.bulk_create(
+        [FeedRecipe(user_id=user_id, recipe=recipe)
+         for user_id in followers.iterator()],
+        batch_size=1000, ignore_conflicts=True)
+
+
+def backfill_feed(user, *authors):
+    """
+    Добавляет в ленту нового подписчика последние рецепты авторов:
+    не более FEED_BACKFILL рецептов каждого автора одним запросом.
+    """
+    authors = [author.pk for author in authors if not is_popular(author)]
+    if not authors:
+        return
+    recipes = Recipe.objects.filter(author__in=authors).annotate(
+        row_number=Window(RowNumber(), partition_by=F('author'),
+                          order_by=F('pk').desc())
+    ).filter(row_number__lte=settings.FEED_BACKFILL).values_list(
+        'pk', flat=True)
+    FeedRecipe.objects.bulk_create(
+        [FeedRecipe(user=user, recipe_id=recipe_id) for recipe_id in recipes],
+        batch_size=1000, ignore_conflicts=True)
+
+
+def remove_from_feed(user, *authors):
+    FeedRecipe.objects.filter(user=user, recipe__author__in=authors).delete()
+
+
+def feed_queryset(queryset, user):
+    """
+    Рецепты ленты пользователя. Обычно это соединение с его строками
+    FeedRecipe по индексу (user, recipe); если пользователь подписан
+    на популярных авторов, их рецепты добавляются чтением по автору.
+    """
+    popular_authors = list(FoodUser.objects.filter(
+        subscription__user=user,
+        followers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).values_list('pk', flat=True))
+
+    if not popular_authors:
+        return queryset.filter(in_feeds__user=user)
+    return queryset.filter(
+        Q(Exists(FeedRecipe.objects.filter(user=user, recipe=OuterRef('pk'))))
+        | Q(author__in=popular_authors))
@@ -1,5 +1,29 @@
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 
+from recipes.models import Recipe
+
+from .tag_cache import tag_cache
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
+
+
+def filter_by_tags(queryset, slugs, match_all=False):
+    """
+    Рецепты с любым из тегов (или со всеми тегами при match_all)
+    через EXISTS по таблице связи рецептов и тегов, без JOIN и DISTINCT.
+    Slug-и переводятся в id по кешу тегов.
+    """
+    tag_ids = {tag['slug']: tag['id'] for tag in tag_cache.all()}
+    ids = {tag_ids[slug] for slug in slugs if slug in tag_ids}
+    if not ids or match_all and len(ids) < len(set(slugs)):
+        return queryset.none()
+
+    links = Recipe.tags.through.objects.filter(recipe_id=OuterRef('pk'))
+    if not match_all:
+        return queryset.filter(Exists(links.filter(tag_id__in=ids)))
+    for tag_id in ids:
+        queryset = queryset.filter(Exists(links.filter(tag_id=tag_id)))
+    return queryset
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from .tag_cache import tag_cache
+
+
+def fragment_cache():
+    return caches[settings.RECIPE_FRAGMENT_CACHE]
+
+
+def fragment_keys(recipes, request):
+    """
+    Ключи фрагментов рецептов. Ключ включает время изменения рецепта,
+    версию тегов и адрес сайта, от которого зависят ссылки на картинки,
+    поэтому устаревший фрагмент никогда не будет прочитан.
+    """
+    base = request.build_absolute_uri('/') if request is not None else ''
+    version = tag_cache.version()
+    return {
+        recipe.pk: (f'recipe:{recipe.pk}:{recipe.modified.timestamp()}:'
+                    f'{version}:{base}')
+        for recipe in recipes
+    }
@@ -0,0 +1,114 @@
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.models import Recipe
+
+from .conditional import RECIPES_VERSION_KEY
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants/'
+VARIANT_FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+PLACEHOLDER_WIDTH = 16
+
+executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS,
+                              thread_name_prefix='recipe-images')
+
+
+def encode(image, image_format, quality=80):
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def generate_image_variants(recipe_id):
+    """
+    Создает уменьшенные копии картинки рецепта в форматах WebP и JPEG
+    и крошечную заглушку в виде data URI, сохраняет их в image_variants.
+    """
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        if not recipe.image:
+            return
+        with recipe.image.open('rb') as image_file:
+            image = ImageOps.exif_transpose(Image.open(image_file))
+            image = image.convert('RGB')
+
+        stem = PurePosixPath(recipe.image.name).stem
+        sizes = {}
+        for width in settings.IMAGE_VARIANT_WIDTHS:
+            variant = image.copy()
+            variant.thumbnail((width, width * 4))
+            sizes[str(width)] = {
+                extension: default_storage.save(
+                    f'{VARIANTS_DIR}{stem}_{width}.{extension}',
+                    ContentFile(encode(variant, image_format)))
+                for extension, image_format in VARIANT_FORMATS
+            }
+
+        placeholder = image.copy()
+        placeholder.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+        placeholder = base64.b64encode(
+            encode(placeholder, 'JPEG', quality=40)).decode()
+
+        Recipe.objects.filter(pk=recipe_id, image=recipe.image.name).update(
+            image_variants={
+                'placeholder': f'data:image/jpeg;base64,{placeholder}',
+                'sizes': sizes,
+            },
+            modified=timezone.now())
+        bump_version(RECIPES_VERSION_KEY)
+    except Exception:
+        logger.exception('Не удалось обработать картинку рецепта %s',
+                         recipe_id)
+
+
+def process_image_variants(recipe_id):
+    """
+    Задача пула потоков: у каждого потока свое соединение с базой,
+    которое закрывается после обработки.
+    """
+    try:
+        generate_image_variants(recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_image_variants(recipe):
+    """
+    Ставит обработку картинки рецепта в пул потоков после коммита,
+    вне цикла обработки запроса.
+    """
+    transaction.on_commit(
+        lambda: executor.submit(process_image_variants, recipe.pk))
+
+
+def image_variant_urls(image_variants, request=None):
+    """
+    Представление image_variants с URL вместо путей в хранилище.
+    """
+    if not image_variants:
+        return {}
+
+    def url(name):
+        url = default_storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    return {
+        'placeholder': image_variants['placeholder'],
+        'sizes': {
+            width: {extension: url(name) for extension, name in files.items()}
+            for width, files in image_variants['sizes'].items()
+        },
+    }
@@ -0,0 +1,181 @@
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from recipes.models import Ingredient
+
+from .versions import bump_version, get_version
+
+VERSION_KEY = 'ingredients:version'
+MAGIC = b'FGI2'
+HEADER = struct.Struct('<4s32sI')
+OFFSET = struct.Struct('<I')
+RECORD = struct.Struct('<QHHH')
+
+
+def build_index(path=None):
+    """
+    Строит отсортированный по имени в нижнем регистре снимок каталога
+    ингредиентов и атомарно заменяет им файл индекса.
+
+    Формат файла: заголовок (магия, версия каталога, число записей),
+    таблица смещений записей, записи вида (id, длины полей, ключ, имя,
+    единица измерения). Версия читается до каталога, поэтому изменение
+    каталога во время построения оставит в файле старую версию.
+    """
+    path = path or settings.INGREDIENT_INDEX_PATH
+    version = get_version(VERSION_KEY)
+    records = sorted(
+        (name.lower().encode(), pk, name.encode(), unit.encode())
+        for pk, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').iterator())
+
+    offsets = bytearray()
+    data = bytearray()
+    for key, pk, name, unit in records:
+        offsets += OFFSET.pack(len(data))
+        data += RECORD.pack(pk, len(key), len(name), len(unit))
+        data += key + name + unit
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(HEADER.pack(MAGIC, version.encode(), len(records)))
+        index_file.write(offsets)
+        index_file.write(data)
+    os.replace(tmp_path, path)
+
+
+class IngredientIndex:
+    """
+    Префиксный индекс ингредиентов для автодополнения.
+
+    Снимок индекса отображается в память через mmap, поэтому все
+    воркеры gunicorn читают одни и те же страницы из кеша ОС.
+    Замена файла индекса замечается по os.stat при следующем поиске.
+    Файл с версией каталога, отличной от ключа версии в общем кеше
+    Django, например оставшийся от другой базы, строится заново.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+
+    def version(self, refresh=False):
+        """
+        Версия каталога из общего кеша. Чтобы не читать кеш при каждом
+        поиске, она хранится в процессе INGREDIENT_INDEX_VERSION_TTL
+        секунд.
+        """
+        now = time.monotonic()
+        cached = self._version
+        if (refresh or cached is None
+                or now - cached[0] >= settings.INGREDIENT_INDEX_VERSION_TTL):
+            cached = (now, get_version(VERSION_KEY).encode())
+            self._version = cached
+        return cached[1]
+
+    def _open(self, path):
+        """
+        Снимок файла индекса или None, если файла нет или это не индекс
+        текущего формата.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if stat.st_size < HEADER.size:
+            return None
+
+        file_id = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == file_id:
+            return snapshot
+
+        with self._lock:
+            with open(path, 'rb') as index_file:
+                buffer = mmap.mmap(index_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC:
+                buffer.close()
+                return None
+            data_start = HEADER.size + count * OFFSET.size
+            self._snapshot = (file_id, version, buffer, count, data_start)
+            return self._snapshot
+
+    def _load(self):
+        path = settings.INGREDIENT_INDEX_PATH
+        snapshot = self._open(path)
+        if snapshot is not None and snapshot[1] == self.version():
+            return snapshot
+        # Файл мог перестроить другой процесс с более новой версией.
+        if snapshot is None or snapshot[1] != self.version(refresh=True):
+            build_index(path)
+            snapshot = self._open(path)
+        return snapshot
+
+    def prime(self):
+        """
+        Загружает снимок индекса заранее, например в мастер-процессе
+        gunicorn до форка воркеров. Возвращает число ингредиентов.
+        """
+        return self._load()[3]
+
+    def invalidate(self):
+        """
+        Меняет версию каталога и перестраивает индекс после коммита.
+        """
+        bump_version(VERSION_KEY)
+        self._version = None
+        transaction.on_commit(self._rebuild)
+
+    def _rebuild(self):
+        self._version = None
+        build_index()
+
+    @staticmethod
+    def _record(buffer, data_start, number):
+        position = data_start + OFFSET.unpack_from(
+            buffer, HEADER.size + number * OFFSET.size)[0]
+        pk, key_length, name_length, unit_length = RECORD.unpack_from(
+            buffer, position)
+        position += RECORD.size
+        key = buffer[position:position + key_length]
+        position += key_length
+        name = buffer[position:position + name_length]
+        position += name_length
+        unit = buffer[position:position + unit_length]
+        return key, pk, name, unit
+
+    def search(self, prefix):
+        """
+        Возвращает ингредиенты, имя которых начинается с prefix
+        без учета регистра, в формате IngredientSerializer.
+        """
+        _, _, buffer, count, data_start = self._load()
+        prefix = prefix.lower().encode()
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(buffer, data_start, middle)[0] < prefix:
+                low = middle + 1
+            else:
+                high = middle
+
+        ingredients = []
+        for number in range(low, count):
+            key, pk, name, unit = self._record(buffer, data_start, number)
+            if not key.startswith(prefix):
+                break
+            ingredients.append({'id': pk, 'name': name.decode(),
+                                'measurement_unit': unit.decode()})
+        return ingredients
+
+
+ingredient_index = IngredientIndex()
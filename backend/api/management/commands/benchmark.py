@@ -0,0 +1,173 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import FoodUser
+from api.metrics import QueryTimer
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку (p50/p99), число SQL-запросов и пропускную '
+            'способность эндпоинтов API на текущей базе и сравнивает '
+            'результат с сохраненным базовым замером.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Запросов на эндпоинт')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append',
+                            help='Замерить только эти эндпоинты')
+        parser.add_argument('--output', type=Path,
+                            help='Сохранить результат в json файл')
+        parser.add_argument('--baseline', type=Path,
+                            help='Сравнить с результатом из json файла')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Допустимый рост p50 относительно '
+                                 'базового замера')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        user = (FoodUser.objects.annotate(links=Count('shopping_cart'))
+                .order_by('-followers_count', '-links').first())
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        if user is None or recipe is None:
+            raise CommandError('База пуста, сначала выполните seed_data')
+
+        endpoints = self.endpoints(user, recipe)
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - set(endpoints)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+            endpoints = {name: endpoints[name]
+                         for name in options['endpoint']}
+
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            False: Client(HTTP_HOST=self.host()),
+            True: Client(HTTP_HOST=self.host(),
+                         HTTP_AUTHORIZATION=f'Token {token.key}'),
+        }
+
+        results = {}
+        for name, (url, authenticated) in endpoints.items():
+            results[name] = self.measure(clients[authenticated], url,
+                                         options['requests'],
+                                         options['warmup'])
+            self.stdout.write(
+                f'{name:<28} p50 {results[name]["p50_ms"]:8.2f} мс  '
+                f'p99 {results[name]["p99_ms"]:8.2f} мс  '
+                f'{results[name]["queries"]:3d} SQL  '
+                f'{results[name]["rps"]:8.1f} rps')
+
+        report = {'database': connection.vendor,
+                  'recipes': Recipe.objects.count(),
+                  'users': FoodUser.objects.count(),
+                  'endpoints': results}
+        if options['output']:
+            Path(options['output']).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2))
+        if options['baseline']:
+            self.compare(results, Path(options['baseline']),
+                         options['threshold'])
+
+    def host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        return hosts[0].lstrip('.') if hosts else 'localhost'
+
+    def endpoints(self, user, recipe):
+        """
+        Эндпоинты для замера: путь и нужна ли авторизация.
+        """
+        tags = '&'.join(f'tags={slug}' for slug in
+                        Tag.objects.values_list('slug', flat=True)[:3])
+        ingredient = Ingredient.objects.values_list('name', flat=True).first()
+        prefix = (ingredient or 'а')[:2]
+        middle_page = max(1, Recipe.objects.count() // 12)
+        return {
+            'recipes': ('/api/recipes/?limit=6', False),
+            'recipes_auth': ('/api/recipes/?limit=6', True),
+            'recipes_middle_page': (
+                f'/api/recipes/?page={middle_page}&limit=6', True),
+            'recipes_cursor': ('/api/recipes/?cursor=&limit=6', True),
+            'recipes_tags': (f'/api/recipes/?limit=6&{tags}', True),
+            'recipes_author': (
+                f'/api/recipes/?limit=6&author={recipe.author_id}', True),
+            'recipes_favorited': (
+                '/api/recipes/?limit=6&is_favorited=1', True),
+            'recipes_search': ('/api/recipes/?limit=6&search=борщ', False),
+            'recipe_detail': (f'/api/recipes/{recipe.pk}/', True),
+            'ingredients_search': (f'/api/ingredients/?name={prefix}',
+                                   False),
+            'tags': ('/api/tags/', False),
+            'users_me': ('/api/users/me/', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?limit=6&recipes_limit=3', True),
+            'feed': ('/api/users/feed/?limit=6', True),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', True),
+        }
+
+    def measure(self, client, url, requests, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+
+        timings = []
+        queries = []
+        started = time.perf_counter()
+        for _ in range(requests):
+            timer = QueryTimer()
+            request_started = time.perf_counter()
+            with ExitStack() as stack:
+                for db in connections.all():
+                    stack.enter_context(db.execute_wrapper(timer))
+                status = self.request(client, url)
+            timings.append((time.perf_counter() - request_started) * 1000)
+            queries.append(timer.count)
+        elapsed = time.perf_counter() - started
+
+        percentiles = statistics.quantiles(timings, n=100,
+                                           method='inclusive')
+        return {
+            'url': url,
+            'status': status,
+            'p50_ms': round(percentiles[49], 3),
+            'p99_ms': round(percentiles[98], 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(queries),
+            'rps': round(requests / elapsed, 1),
+        }
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def compare(self, results, path, threshold):
+        baseline = json.loads(path.read_text())['endpoints']
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            ratio = result['p50_ms'] / before['p50_ms']
+            self.stdout.write(
+                f'{name:<28} p50 x{ratio:.2f}  '
+                f'SQL {before["queries"]} -> {result["queries"]}')
+            if ratio > threshold or result['queries'] > before['queries']:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(
+                f'Регрессия относительно {path}: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,91 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from users.models import FoodUser
+from api.shopping_list import shopping_list_queryset
+from api.tag_cache import tag_cache
+from api.views import FoodUserView, RecipeViewSet
+
+
+class Command(BaseCommand):
+    help = ('Выводит планы горячих запросов из api/views.py и проверяет, '
+            'что PostgreSQL использует для них составные индексы.')
+
+    def make_view(self, view_class, user, path, params=None):
+        request = Request(APIRequestFactory().get(path, params or {}))
+        request.user = user
+        return view_class(request=request, action='list',
+                          format_kwarg=None, kwargs={})
+
+    def hot_queries(self, user):
+        recipes = self.make_view(RecipeViewSet, user, '/api/recipes/')
+        tags = [tag['slug'] for tag in tag_cache.all()[:2]]
+        queries = [
+            ('recipes: is_favorited/is_in_shopping_cart',
+             recipes.get_queryset(),
+             ('unique_favorite', 'unique_shopping_cart')),
+            ('recipes: ?is_favorited',
+             self.make_view(RecipeViewSet, user, '/api/recipes/',
+                            {'is_favorited': 1}).get_queryset(),
+             ('unique_favorite',)),
+            ('recipes: ?is_in_shopping_cart',
+             self.make_view(RecipeViewSet, user, '/api/recipes/',
+                            {'is_in_shopping_cart': 1}).get_queryset(),
+             ('unique_shopping_cart',)),
+            ('recipes: ?author',
+             self.make_view(RecipeViewSet, user, '/api/recipes/',
+                            {'author': user.pk}).get_queryset(),
+             ('recipe_author_id_idx',)),
+            ('download_shopping_cart',
+             shopping_list_queryset(user),
+             ('unique_shopping_cart', 'unique_recipe_ingredient')),
+            ('users: subscriptions',
+             self.make_view(FoodUserView, user, '/api/users/subscriptions/')
+             .get_subscriptions_queryset()
+             .filter(subscription__user=user),
+             ('unique_subscribe',)),
+        ]
+        if tags:
+            queries.append((
+                'recipes: ?tags',
+                self.make_view(RecipeViewSet, user, '/api/recipes/',
+                               {'tags': tags}).get_queryset(),
+                ('recipes_recipe_tags_tag_recipe_idx',)))
+        return queries
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        user = FoodUser.objects.order_by('pk').first() or FoodUser(pk=0)
+        check = connection.vendor == 'postgresql'
+        if check:
+            # На маленьких таблицах планировщик предпочитает seq scan,
+            # проверяем, что индекс в принципе применим к запросу.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+        missing = []
+        try:
+            for name, queryset, indexes in self.hot_queries(user):
+                plan = queryset.explain()
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(plan)
+                unused = [index for index in indexes if index not in plan]
+                if check and unused:
+                    missing.append(f'{name}: {", ".join(unused)}')
+        finally:
+            if check:
+                with connection.cursor() as cursor:
+                    cursor.execute('RESET enable_seqscan')
+
+        if not check:
+            self.stdout.write(self.style.WARNING(
+                'Проверка индексов выполняется только на PostgreSQL'))
+        elif missing:
+            raise CommandError('Индексы не используются:\n'
+                               + '\n'.join(missing))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Все горячие запросы используют индексы'))
@@ -0,0 +1,27 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from api.images import executor, process_image_variants
+
+
+class Command(BaseCommand):
+    help = ('Создает уменьшенные копии картинок рецептов, у которых '
+            'их еще нет (или у всех рецептов с --all).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipe_ids = list(recipes.values_list('pk', flat=True))
+
+        for number, _ in enumerate(
+                executor.map(process_image_variants, recipe_ids), 1):
+            if number % 100 == 0:
+                self.stdout.write(f'Обработано {number} рецептов')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {len(recipe_ids)} рецептов'))
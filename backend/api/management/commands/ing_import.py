@@ -1,26 +1,85 @@
 import csv
-import io
-import os
+import json
+import time
+from itertools import islice
+from pathlib import Path
 from typing import Any
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
 from recipes.models import Ingredient
+from api.ingredient_index import ingredient_index
 
 
-os.chdir('//app//data')
-DATAFOLDER = os.getcwd()
+DEFAULT_PATH = Path(settings.BASE_DIR) / 'data' / 'ingredients.csv'
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из csv или json файла пакетами, '
+            'пропуская уже существующие.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH,
+                            type=Path)
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='Формат файла, по умолчанию по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000)
 
     def handle(self, *args: Any, **options: Any) -> str | None:
-        self.import_ingredients()
-
-    def import_ingredients(self):
-        with io.open(DATAFOLDER + '//ingredients.csv', encoding='utf-8') as f:
-            for row in csv.reader(f, delimiter=','):
-                Ingredient.objects.get_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
+        path = options['path']
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+        file_format = options['format'] or path.suffix.lstrip('.')
+        if file_format not in ('csv', 'json'):
+            raise CommandError(f'Неизвестный формат файла {path}')
+
+        with path.open(encoding='utf-8') as source:
+            if file_format == 'csv':
+                rows = self.read_csv(source)
+            else:
+                rows = self.read_json(source)
+            self.import_ingredients(rows, options['batch_size'])
+
+        ingredient_index.invalidate()
+
+    def read_csv(self, source):
+        for row in csv.reader(source, delimiter=','):
+            if row:
+                yield row[0], row[1]
+
+    def read_json(self, source):
+        for item in json.load(source):
+            yield item['name'], item['measurement_unit']
+
+    def unique_rows(self, rows):
+        seen = set()
+        for name, measurement_unit in rows:
+            key = (name.strip(), measurement_unit.strip())
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def import_ingredients(self, rows, batch_size):
+        started = time.perf_counter()
+        total = 0
+        rows = self.unique_rows(rows)
+
+        while batch := list(islice(rows, batch_size)):
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch],
+                ignore_conflicts=True
+            )
+            total += len(batch)
+            self.report(total, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {total} уникальных ингредиентов, '
+            f'в базе {Ingredient.objects.count()}'))
+
+    def report(self, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{total} строк за {elapsed:.2f} с '
+            f'({total / elapsed if elapsed else total:.0f} строк/с)')
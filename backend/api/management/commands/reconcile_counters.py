@@ -0,0 +1,23 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import FavoriteRecipe, Recipe
+from users.models import FoodUser, Subscription
+from api.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = ('Сверяет денормализованные счетчики favorites_count, '
+            'recipes_count и followers_count с данными и исправляет '
+            'расхождения.')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        fixed = reconcile(Recipe, 'favorites_count',
+                          FavoriteRecipe, 'recipe')
+        self.stdout.write(f'Recipe.favorites_count: исправлено {fixed}')
+        fixed = reconcile(FoodUser, 'recipes_count', Recipe, 'author')
+        self.stdout.write(f'FoodUser.recipes_count: исправлено {fixed}')
+        fixed = reconcile(FoodUser, 'followers_count',
+                          Subscription, 'subscription')
+        self.stdout.write(f'FoodUser.followers_count: исправлено {fixed}')
@@ -0,0 +1,201 @@
+import random
+import time
+from itertools import accumulate
+from typing import Any
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import (FavoriteRecipe, FeedRecipe, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCartRecipes,
+                            Tag)
+from users.models import FoodUser, Subscription
+from api.conditional import RECIPES_VERSION_KEY
+from api.counters import reconcile
+from api.feed import backfill_feed
+from api.ingredient_index import ingredient_index
+from api.search import refresh_search_vectors
+from api.versions import bump_version
+
+SEED_DOMAIN = 'seed.foodgram'
+SEED_PASSWORD = 'seedpassword123!'
+WORDS = ('борщ', 'суп', 'салат', 'пирог', 'каша', 'омлет', 'паста',
+         'рагу', 'плов', 'блины', 'котлеты', 'запеканка', 'курица',
+         'грибы', 'сырники', 'шарлотка', 'оливье', 'солянка')
+TAGS = (('Завтрак', 'seed-breakfast', '#E26C2D'),
+        ('Обед', 'seed-lunch', '#49B64E'),
+        ('Ужин', 'seed-dinner', '#8775D2'))
+
+
+class Zipf:
+    """
+    Выбор элементов с убывающей по рангу частотой: первые элементы
+    встречаются намного чаще, как популярные авторы и рецепты.
+    """
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)))
+        self.rng = rng
+
+    def sample(self, count):
+        """
+        До count различных элементов.
+        """
+        count = min(count, len(self.items))
+        chosen = set()
+        for _ in range(count * 3):
+            chosen.update(self.rng.choices(
+                self.items, cum_weights=self.cum_weights,
+                k=count - len(chosen)))
+            if len(chosen) >= count:
+                break
+        return chosen
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, списками покупок и подписками с неравномерным '
+            'распределением для нагрузочных замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int,
+                            default=10)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Удалить ранее созданные данные')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        if options['clear']:
+            deleted, _ = FoodUser.objects.filter(
+                email__endswith=f'@{SEED_DOMAIN}').delete()
+            self.stdout.write(f'Удалено {deleted} объектов')
+        if FoodUser.objects.filter(
+                email__endswith=f'@{SEED_DOMAIN}').exists():
+            raise CommandError('Данные уже созданы, используйте --clear')
+
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(
+                users, options['recipes'], options['ingredients_per_recipe'],
+                options['skew'])
+            self.create_links(FavoriteRecipe, 'recipe', users, recipes,
+                              options['favorites_per_user'], options['skew'])
+            self.create_links(ShoppingCartRecipes, 'recipe', users, recipes,
+                              options['cart_per_user'], options['skew'])
+            self.create_links(Subscription, 'subscription', users, users,
+                              options['subscriptions_per_user'],
+                              options['skew'])
+            self.finish(users)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def bulk_create(self, model, objects, ignore_conflicts=True):
+        created = model.objects.bulk_create(
+            objects, batch_size=self.batch_size,
+            ignore_conflicts=ignore_conflicts)
+        self.stdout.write(f'{model.__name__}: {len(objects)}')
+        return created
+
+    def create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        self.bulk_create(FoodUser, [
+            FoodUser(email=f'user{number}@{SEED_DOMAIN}',
+                     username=f'seed_user{number}',
+                     first_name='Seed', last_name=f'User{number}',
+                     password=password)
+            for number in range(count)])
+        return list(FoodUser.objects.filter(
+            email__endswith=f'@{SEED_DOMAIN}').order_by('pk')
+            .values_list('pk', flat=True))
+
+    def get_ingredients(self):
+        ingredients = list(Ingredient.objects.values_list('pk', flat=True))
+        if len(ingredients) < 100:
+            self.bulk_create(Ingredient, [
+                Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+                for number in range(1000)])
+            ingredients = list(Ingredient.objects.values_list(
+                'pk', flat=True))
+        return ingredients
+
+    def get_tags(self):
+        for name, slug, color in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_recipes(self, users, count, ingredients_per_recipe, skew):
+        authors = Zipf(users, skew, self.rng)
+        rng = self.rng
+        recipes = self.bulk_create(Recipe, [
+            Recipe(author_id=rng.choices(
+                       authors.items, cum_weights=authors.cum_weights)[0],
+                   name=' '.join(rng.sample(WORDS, 2)).capitalize(),
+                   text=' '.join(rng.choices(WORDS, k=30)),
+                   cooking_time=rng.randint(5, 180),
+                   image='recipes/images/seed.png')
+            for _ in range(count)], ignore_conflicts=False)
+        recipe_ids = [recipe.pk for recipe in recipes]
+
+        ingredients = Zipf(self.get_ingredients(), skew, rng)
+        links = []
+        for recipe_id in recipe_ids:
+            size = max(1, int(rng.gauss(ingredients_per_recipe,
+                                        ingredients_per_recipe / 3)))
+            links.extend(
+                IngredientRecipe(recipe_id=recipe_id, ingredient_id=pk,
+                                 amount=rng.randint(1, 500))
+                for pk in ingredients.sample(size))
+        self.bulk_create(IngredientRecipe, links)
+
+        tags = self.get_tags()
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tags, rng.randint(1, min(2, len(tags))))
+        ])
+        return recipe_ids
+
+    def create_links(self, model, field, users, targets, per_user, skew):
+        targets = Zipf(targets, skew, self.rng)
+        links = []
+        for user_id in users:
+            size = self.rng.randint(0, per_user * 2)
+            links.extend(
+                model(user_id=user_id, **{f'{field}_id': target_id})
+                for target_id in targets.sample(size)
+                if field != 'subscription' or target_id != user_id)
+        self.bulk_create(model, links)
+
+    def finish(self, users):
+        """
+        Заполняет то, что при обычной записи делают сигналы: счетчики,
+        ленты, поисковые векторы, индекс ингредиентов и версии кешей.
+        """
+        reconcile(Recipe, 'favorites_count', FavoriteRecipe, 'recipe')
+        reconcile(FoodUser, 'recipes_count', Recipe, 'author')
+        reconcile(FoodUser, 'followers_count', Subscription, 'subscription')
+
+        for user in FoodUser.objects.filter(pk__in=users).only('pk'):
+            backfill_feed(user, *FoodUser.objects.filter(
+                subscription__user=user).only('pk', 'followers_count'))
+        self.stdout.write(f'FeedRecipe: {FeedRecipe.objects.count()}')
+
+        refresh_search_vectors(Recipe.objects.filter(author__in=users))
+        ingredient_index.invalidate()
+        bump_version(RECIPES_VERSION_KEY)
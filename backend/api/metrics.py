@@ -0,0 +1,315 @@
+import glob
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0,
+                5.0)
+
+HISTOGRAMS = {
+    'foodgram_http_request_duration_seconds': (
+        'Время обработки запроса', LATENCY_BUCKETS),
+    'foodgram_http_db_queries': (
+        'Число SQL-запросов на HTTP-запрос', QUERY_BUCKETS),
+    'foodgram_http_response_size_bytes': (
+        'Размер ответа', SIZE_BUCKETS),
+    'foodgram_db_pool_wait_seconds': (
+        'Ожидание соединения из пула', WAIT_BUCKETS),
+}
+COUNTERS = {
+    'foodgram_http_db_seconds_total': 'Суммарное время SQL-запросов',
+    'foodgram_db_pool_timeouts_total': (
+        'Запросы соединения, не дождавшиеся его в пуле'),
+}
+GAUGES = {
+    'foodgram_db_pool_size': 'Открытые соединения пула',
+    'foodgram_db_pool_available': 'Свободные соединения пула',
+    'foodgram_db_pool_waiting': 'Запросы, ожидающие соединение из пула',
+}
+
+
+class Registry:
+    """
+    Метрики процесса. Каждый процесс раз в METRICS_DUMP_INTERVAL секунд
+    сохраняет снимок в METRICS_DIR, эндпоинт метрик складывает снимки
+    всех процессов, поэтому с несколькими воркерами счетчики не теряются.
+    Значения gauge-метрик возвращают функции из add_gauges в момент
+    снимка, снимки завершившихся процессов для них не учитываются.
+    """
+    def __init__(self):
+        self.gauge_callbacks = []
+        self.reset()
+
+    def reset(self):
+        """
+        Обнуляет метрики. Вызывается в процессе после fork, чтобы воркеры
+        не учитывали повторно то, что мастер-процесс записал при прогреве.
+        """
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.counters = {name: {} for name in COUNTERS}
+        self.dumped_at = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            series = self.histograms[name].setdefault(
+                labels, [0] * (len(buckets) + 2))
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            series = self.counters[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def add_gauges(self, callback):
+        """
+        callback() возвращает пары ((имя, метки), значение).
+        """
+        self.gauge_callbacks.append(callback)
+
+    def gauges(self):
+        gauges = {name: {} for name in GAUGES}
+        for callback in self.gauge_callbacks:
+            for (name, labels), value in callback():
+                gauges[name][json.dumps(labels)] = value
+        return gauges
+
+    def snapshot(self):
+        gauges = self.gauges()
+        with self.lock:
+            return {
+                'histograms': {
+                    name: {json.dumps(labels): list(series)
+                           for labels, series in values.items()}
+                    for name, values in self.histograms.items()},
+                'counters': {
+                    name: {json.dumps(labels): value
+                           for labels, value in values.items()}
+                    for name, values in self.counters.items()},
+                'gauges': gauges,
+            }
+
+    def dump_path(self):
+        return os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+
+    def dump(self, force=False):
+        now = time.monotonic()
+        if not settings.METRICS_DIR or (
+                not force
+                and now - self.dumped_at < settings.METRICS_DUMP_INTERVAL):
+            return
+        self.dumped_at = now
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = self.dump_path()
+        with open(f'{path}.tmp', 'w') as snapshot:
+            json.dump(self.snapshot(), snapshot)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """
+        Снимок текущего процесса, сложенный со снимками остальных.
+        """
+        if not settings.METRICS_DIR:
+            return self.snapshot()
+        self.dump(force=True)
+        total = {'histograms': {}, 'counters': {}, 'gauges': {}}
+        for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+            try:
+                with open(path) as snapshot:
+                    snapshot = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            if process_alive(path):
+                for name, values in snapshot.get('gauges', {}).items():
+                    merged = total['gauges'].setdefault(name, {})
+                    for labels, value in values.items():
+                        merged[labels] = merged.get(labels, 0) + value
+            for name, values in snapshot['histograms'].items():
+                merged = total['histograms'].setdefault(name, {})
+                for labels, series in values.items():
+                    if labels in merged:
+                        series = [a + b for a, b in zip(merged[labels],
+                                                        series)]
+                    merged[labels] = series
+            for name, values in snapshot['counters'].items():
+                merged = total['counters'].setdefault(name, {})
+                for labels, value in values.items():
+                    merged[labels] = merged.get(labels, 0) + value
+        return total
+
+
+def process_alive(path):
+    pid = int(os.path.basename(path).split('.')[0])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in pairs) + '}'
+
+
+def render_metrics(snapshot):
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for labels, series in sorted(snapshot['histograms'].get(
+                name, {}).items()):
+            labels = json.loads(labels)
+            for bound, count in zip(buckets, series):
+                lines.append(f'{name}_bucket'
+                             f'{format_labels(labels, le=bound)} {count}')
+            lines.append(f'{name}_bucket'
+                         f'{format_labels(labels, le="+Inf")} {series[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {series[-2]}')
+            lines.append(f'{name}_count{format_labels(labels)} {series[-1]}')
+    for name, help_text in COUNTERS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for labels, value in sorted(snapshot['counters'].get(
+                name, {}).items()):
+            lines.append(f'{name}{format_labels(json.loads(labels))} {value}')
+    for name, help_text in GAUGES.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in sorted(snapshot['gauges'].get(
+                name, {}).items()):
+            lines.append(f'{name}{format_labels(json.loads(labels))} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryTimer:
+    """
+    Число и время SQL-запросов одного HTTP-запроса.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+_query_timer = ContextVar('query_timer', default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    """
+    Ставит time_query в execute_wrappers соединения. Соединения
+    принадлежат потокам, а асинхронные view выполняют запросы в потоках
+    sync_to_async, поэтому обертка стоит на каждом соединении, а таймер
+    запроса передается через ContextVar, который sync_to_async копирует
+    в поток. Обертка ставится первой, чтобы execute_wrapper() снимал
+    свои обертки, а не ее.
+    """
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, time_query)
+
+
+class MetricsMiddleware:
+    """
+    Собирает по каждому view время ответа, число и время SQL-запросов
+    и размер ответа. Запросы, выполненные при отдаче потокового ответа,
+    не учитываются. Работает и в синхронном, и в асинхронном режиме:
+    запросы считаются в том потоке, где выполняются (install_query_timer).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        token = _query_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self.record(request, response, timer, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, timer, duration):
+        match = request.resolver_match
+        labels = (('view', match.view_name if match else 'unmatched'),
+                  ('method', request.method),
+                  ('status', response.status_code))
+        registry.observe('foodgram_http_request_duration_seconds', labels,
+                         duration)
+        registry.observe('foodgram_http_db_queries', labels, timer.count)
+        registry.inc('foodgram_http_db_seconds_total', labels,
+                     timer.duration)
+        if not response.streaming:
+            registry.observe('foodgram_http_response_size_bytes', labels,
+                             len(response.content))
+        registry.dump()
+
+
+def metrics_view(request):
+    """
+    Эндпоинт для Prometheus, доступен только адресам
+    из METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(render_metrics(registry.collect()),
+                        content_type='text/plain; version=0.0.4')
@@ -1,6 +1,33 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
-class FoodPageLimitPaginator(PageNumberPagination):
+class FoodCursorPaginator(CursorPagination):
+    """
+    Keyset-пагинация по убыванию первичного ключа без запроса COUNT.
+    """
+    page_size_query_param = 'limit'
+    ordering = '-pk'
+
 
+class FoodPageLimitPaginator(PageNumberPagination):
+    """
+    Постраничная пагинация с параметром limit. При наличии в запросе
+    параметра cursor (в том числе пустого) переключается на
+    FoodCursorPaginator, который всегда сортирует по убыванию id,
+    поэтому поиск рецептов с cursor отклоняется.
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = FoodCursorPaginator()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
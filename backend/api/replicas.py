@@ -0,0 +1,141 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_db'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_routing = ContextVar('replica_routing', default=None)
+
+
+class Routing:
+    """
+    Маршрутизация запросов к базе в рамках одного HTTP-запроса.
+    replica: реплика для всех чтений запроса, чтобы ETag, ключи кеша
+    и тело ответа читались с одной и той же реплики; pinned: все чтения
+    идут в основную базу; wrote: запрос что-то записал, и пользователь
+    закрепляется за основной базой.
+    """
+    def __init__(self, pinned=False):
+        self.replica = None
+        if settings.DATABASE_REPLICAS:
+            self.replica = random.choice(settings.DATABASE_REPLICAS)
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def request_routing(pinned=False):
+    """
+    Включает маршрутизацию чтений в реплики на время обработки запроса.
+    """
+    routing = Routing(pinned)
+    token = _routing.set(routing)
+    try:
+        yield routing
+    finally:
+        _routing.reset(token)
+
+
+def use_primary():
+    """
+    Направляет оставшиеся чтения текущего запроса в основную базу.
+    Возвращает False, если они и так шли в нее.
+    """
+    routing = _routing.get()
+    if routing is None or routing.pinned or routing.replica is None:
+        return False
+    routing.pinned = True
+    return True
+
+
+class ReplicaRouter:
+    """
+    Чтения внутри HTTP-запроса идут в выбранную для запроса случайную
+    реплику из DATABASE_REPLICAS, запись и все остальное - в основную базу.
+    Чтения идут в основную базу, если запрос изменяет данные, уже
+    что-то записал, выполняется в транзакции или пользователь недавно
+    что-то записал (см. ReplicaMiddleware).
+    """
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if (routing is None or routing.pinned or routing.replica is None
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.pinned = routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'replica:pin:' + hashlib.md5(authorization.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+    """
+    Закрепляет клиента за основной базой на REPLICA_PIN_SECONDS после
+    записи, чтобы он видел свои изменения, пока они доходят до реплик.
+    Клиент узнается по cookie, а клиент с заголовком Authorization
+    еще и по ключу в кеше, так как API-клиенты часто не хранят cookie.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        with request_routing(self.is_pinned(request)) as routing:
+            response = self.get_response(request)
+        self.pin(request, response, routing)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        with request_routing(self.is_pinned(request)) as routing:
+            response = await self.get_response(request)
+        self.pin(request, response, routing)
+        return response
+
+    def is_pinned(self, request):
+        if request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+            return True
+        key = pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def pin(self, request, response, routing):
+        if not routing.wrote:
+            return
+        response.set_cookie(PIN_COOKIE, '1',
+                            max_age=settings.REPLICA_PIN_SECONDS,
+                            httponly=True, samesite='Lax')
+        key = pin_key(request)
+        if key is not None:
+            cache.set(key, True, settings.REPLICA_PIN_SECONDS)
@@ -0,0 +1,67 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import F, OuterRef, Q, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+from recipes.models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+def recipe_search_vector(ingredient_names):
+    """
+    Поисковый вектор рецепта: название важнее описания,
+    описание важнее ингредиентов. ingredient_names - строка
+    или выражение.
+    """
+    if isinstance(ingredient_names, str):
+        ingredient_names = Value(ingredient_names)
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(ingredient_names, weight='C',
+                           config=SEARCH_CONFIG))
+
+
+def update_search_vector(recipe):
+    """
+    Пересчитывает сохраненный поисковый вектор рецепта.
+    Вызывается после записи рецепта и его ингредиентов.
+    """
+    if connections[Recipe.objects.db].vendor != 'postgresql':
+        return
+    ingredient_names = ' '.join(
+        recipe.ingredients.values_list('name', flat=True))
+    Recipe.objects.filter(pk=recipe.pk).update(
+        search_vector=recipe_search_vector(ingredient_names))
+
+
+def refresh_search_vectors(queryset):
+    """
+    Пересчитывает поисковые векторы рецептов queryset одним запросом.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return 0
+    ingredient_names = IngredientRecipe.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')).values('names')
+    return queryset.update(search_vector=recipe_search_vector(
+        Coalesce(Subquery(ingredient_names), Value(''),
+                 output_field=TextField())))
+
+
+def search_recipes(queryset, text):
+    """
+    Полнотекстовый поиск рецептов по GIN-индексу с ранжированием.
+    На базах кроме PostgreSQL поиск выполняется через icontains.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(Q(name__icontains=text)
+                               | Q(text__icontains=text))
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', '-pk')
@@ -1,13 +1,20 @@
 import webcolors
 import base64
 from rest_framework import serializers
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Manager, Prefetch
 
 from users.models import FoodUser, Subscription
-from recipes.models import (Tag, Ingredient, Recipe,
-                            IngredientRecipe, FavoriteRecipe,
-                            ShoppingCartRecipes)
+from recipes.models import (Tag, Ingredient, Recipe, IngredientRecipe,
+                            FavoriteRecipe, ShoppingCartRecipes)
+
+from .bulk import delete_rows
+from .fragments import fragment_cache, fragment_keys
+from .images import image_variant_urls, schedule_image_variants
+from .search import update_search_vector
+from .tag_cache import tag_cache
 
 
 class Hex2NameColor(serializers.Field):
@@ -35,6 +42,28 @@ class Base64ImageField(serializers.ImageField):
         return super().to_internal_value(data)
 
 
+def get_subscribed_ids(request):
+    """
+    Возвращает множество id авторов, на которых подписан пользователь.
+    Загружается одним запросом и кешируется на объекте запроса.
+    """
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    if not hasattr(request, '_subscribed_ids'):
+        request._subscribed_ids = frozenset(
+            Subscription.objects.filter(user=request.user)
+            .values_list('subscription_id', flat=True))
+    return request._subscribed_ids
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Поле с URL уменьшенных копий картинки рецепта и заглушкой.
+    """
+    def to_representation(self, value):
+        return image_variant_urls(value, self.context.get('request'))
+
+
 class FoodUserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
 
@@ -44,14 +73,7 @@ class FoodUserSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-
-        if not user.is_anonymous or not user == obj:
-            return Subscription.objects.filter(
-                user=user.id,
-                subscription=obj
-            ).exists()
-        return False
+        return obj.id in get_subscribed_ids(self.context.get('request'))
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -93,9 +115,7 @@ class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
     """
     Сериализатор для ввода информации для модели IngredientRecipe.
     """
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(source='ingredient_id')
 
     class Meta:
         model = IngredientRecipe
@@ -104,7 +124,9 @@ class IngredientRecipeWriteSerializer(serializers.ModelSerializer):
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """
-    Сериализатор для записи в модель Recipe
+    Сериализатор для записи в модель Recipe.
+    Ингредиенты проверяются одним запросом, при изменении рецепта
+    вставляются, меняются и удаляются только отличающиеся строки.
     """
     image = Base64ImageField(required=True, allow_null=True)
     author = FoodUserSerializer(default=serializers.CurrentUserDefault())
@@ -116,46 +138,156 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                   'name', 'image', 'text', 'cooking_time']
         read_only_fields = ('author',)
 
-    def ing_recipe_create(self, ing_amount, recipe):
+    def validate_ingredients(self, value):
+        ingredients = [ing['ingredient_id'] for ing in value]
+        if len(ingredients) != len(set(ingredients)):
+            raise serializers.ValidationError(
+                'Ингредиенты рецепта не должны повторяться')
+        found = Ingredient.objects.in_bulk(ingredients)
+        missing = [pk for pk in ingredients if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'Ингредиенты не найдены: {missing}')
+        return value
+
+    def set_ingredients(self, recipe, ing_amount):
+        """
+        Приводит строки IngredientRecipe рецепта к ing_amount:
+        не больше одной вставки, одного обновления и одного удаления.
+        Сигналы строк не отправляются, рецепт отмечается измененным
+        при его сохранении.
+        """
+        amounts = {ing['ingredient_id']: ing['amount'] for ing in ing_amount}
+        existing = IngredientRecipe.objects.filter(recipe=recipe)
+
+        changed = []
+        removed = []
+        for link in existing:
+            if link.ingredient_id not in amounts:
+                removed.append(link.pk)
+            elif link.amount != amounts[link.ingredient_id]:
+                link.amount = amounts[link.ingredient_id]
+                changed.append(link)
+            amounts.pop(link.ingredient_id, None)
+
+        delete_rows(IngredientRecipe, removed)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
         IngredientRecipe.objects.bulk_create(
-            [IngredientRecipe(
-                ingredient=get_object_or_404(Ingredient,
-                                             pk=ing['ingredient'].id),
-                recipe=recipe,
-                amount=ing['amount'])
-                for ing in ing_amount]
-        )
+            [IngredientRecipe(recipe=recipe, ingredient_id=pk, amount=amount)
+             for pk, amount in amounts.items()])
 
+    @transaction.atomic
     def create(self, validated_data):
         ing_amount = validated_data.pop('ingredients')
         recipe = super().create(validated_data)
 
-        self.ing_recipe_create(ing_amount, recipe)
+        self.set_ingredients(recipe, ing_amount)
+        update_search_vector(recipe)
+        schedule_image_variants(recipe)
 
         return recipe
 
     def to_representation(self, instance):
+        """
+        У сохраненного рецепта нет аннотаций флагов, поэтому они
+        проверяются здесь и передаются RecipeReadSerializer в контексте.
+        """
+        request = self.context.get('request')
+        flags = {'is_favorited': False, 'is_in_shopping_cart': False}
+        if request is not None and request.user.is_authenticated:
+            flags = {
+                'is_favorited': FavoriteRecipe.objects.filter(
+                    user=request.user, recipe=instance).exists(),
+                'is_in_shopping_cart': ShoppingCartRecipes.objects.filter(
+                    user=request.user, recipe=instance).exists(),
+            }
         return RecipeReadSerializer(instance=instance,
-                                    context=self.context).data
+                                    context={**self.context, **flags}).data
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if 'ingredients' in validated_data:
-            ing_amount = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.ing_recipe_create(ing_amount, instance)
+            self.set_ingredients(instance, validated_data.pop('ingredients'))
 
         super().update(instance, validated_data)
+        update_search_vector(instance)
+        if 'image' in validated_data:
+            schedule_image_variants(instance)
 
         return instance
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+def recipe_render_queryset():
     """
-    Сериализатор для чтения записей модели Recipe
+    Рецепты со всем, что нужно для их фрагментов: автором, тегами
+    и ингредиентами.
+    """
+    return Recipe.objects.select_related('author').prefetch_related(
+        'recipe_ingredient__ingredient',
+        Prefetch('tags', queryset=Tag.objects.only('id')))
+
+
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """
+    Автор рецепта во фрагменте, без зависящего от пользователя
+    is_subscribed.
+    """
+    class Meta:
+        model = FoodUser
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """
+    Не зависящая от пользователя часть рецепта, которая хранится
+    в кеше фрагментов.
     """
     image = Base64ImageField()
-    tags = TagSerializer(read_only=True, many=True)
+    image_variants = ImageVariantsField()
+    tags = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
+    author = RecipeAuthorSerializer()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'tags', 'author', 'ingredients', 'name',
+                  'image', 'image_variants', 'text', 'cooking_time']
+
+    def get_tags(self, obj):
+        """
+        Теги берутся из кеша каталога тегов, от рецепта нужны только id.
+        render_many передает словарь тегов в контексте, чтобы версия
+        каталога проверялась один раз на страницу.
+        """
+        tags_by_id = self.context.get('tags')
+        if tags_by_id is None:
+            tags_by_id = tag_cache.mapping()
+        tags = (tags_by_id.get(tag.id) for tag in obj.tags.all())
+        return [tag for tag in tags if tag is not None]
+
+    def get_ingredients(self, obj):
+        return IngredientRecipeReadSerializer(
+            instance=obj.recipe_ingredient.all(),
+            many=True
+        ).data
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, Manager):
+            data = data.all()
+        return self.child.render_many(list(data))
+
+
+class RecipeReadSerializer(RecipeFragmentSerializer):
+    """
+    Сериализатор для чтения записей модели Recipe.
+    Не зависящая от пользователя часть рецепта берется из кеша
+    фрагментов, флаги пользователя подставляются поверх нее.
+    Рецептам достаточно полей id, author и modified и аннотаций
+    флагов, недостающие фрагменты строятся одним запросом.
+    """
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -165,40 +297,81 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = ['id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart', 'name',
-                  'image', 'text', 'cooking_time']
+                  'image', 'image_variants', 'text', 'cooking_time']
         read_only_fields = ('author',)
+        list_serializer_class = RecipeListSerializer
 
-    def get_ingredients(self, obj):
-        return IngredientRecipeReadSerializer(
-            instance=obj.recipe_ingredient.all(),
-            many=True
-        ).data
+    def to_representation(self, instance):
+        return self.render_many([instance])[0]
+
+    def render_many(self, recipes):
+        request = self.context.get('request')
+        cache = fragment_cache()
+        keys = fragment_keys(recipes, request)
+        fragments = cache.get_many(keys.values())
+
+        missing = [pk for pk, key in keys.items() if key not in fragments]
+        if missing:
+            renderer = RecipeFragmentSerializer(
+                context={**self.context, 'tags': tag_cache.mapping()})
+            rendered = {
+                keys[recipe.pk]: renderer.to_representation(recipe)
+                for recipe in recipe_render_queryset().filter(pk__in=missing)
+            }
+            cache.set_many(rendered)
+            fragments.update(rendered)
+
+        subscribed_ids = get_subscribed_ids(request)
+        result = []
+        for recipe in recipes:
+            fragment = fragments.get(keys[recipe.pk])
+            if fragment is None:
+                fragment = RecipeFragmentSerializer(
+                    context=self.context).to_representation(recipe)
+            user_fields = {
+                'author': dict(
+                    fragment['author'],
+                    is_subscribed=recipe.author_id in subscribed_ids),
+                'is_favorited': self.get_is_favorited(recipe),
+                'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            }
+            result.append({
+                name: (user_fields[name] if name in user_fields
+                       else fragment[name])
+                for name in self.Meta.fields
+            })
+        return result
 
     def get_is_favorited(self, obj):
-        return FavoriteRecipe.objects.filter(
-            user=self.context['request'].user.id,
-            recipe=obj
-        ).exists()
+        """
+        Флаг вычисляется аннотацией в get_recipe_queryset, без аннотации
+        он берется из контекста. Запросов к базе здесь нет.
+        """
+        return self.user_flag(obj, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return ShoppingCartRecipes.objects.filter(
-            user=self.context['request'].user.id,
-            recipe=obj
-        ).exists()
+        return self.user_flag(obj, 'is_in_shopping_cart')
+
+    def user_flag(self, obj, name):
+        return getattr(obj, name, self.context.get(name, False))
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
         read_only_fields = ("__all__",)
 
 
 class SubsciptionReadSerializer(serializers.ModelSerializer):
+    """
+    Сериализатор автора в подписках. Ожидает prefetch рецептов
+    из FoodUserView.get_subscriptions_queryset.
+    """
     is_subscribed = serializers.SerializerMethodField()
-    recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes = ShortRecipeSerializer(many=True, read_only=True)
 
     class Meta:
         model = FoodUser
@@ -209,12 +382,12 @@ class SubsciptionReadSerializer(serializers.ModelSerializer):
     def get_is_subscribed(self, obj):
         return True
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
 
-    def get_recipes(self, obj):
-        if self.context.get('recipes_limit'):
-            recipes = obj.recipes.all()[0:self.context.get('recipes_limit')]
-        else:
-            recipes = obj.recipes.all()
-        return ShortRecipeSerializer(recipes, many=True, read_only=True).data
+class BulkIdsSerializer(serializers.Serializer):
+    """
+    Список id рецептов или авторов для массовых операций.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_MAX_IDS)
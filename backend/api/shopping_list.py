@@ -0,0 +1,132 @@
+import csv
+import hashlib
+import json
+
+from django.db.models import Count, F, Max, Sum
+from django.utils.cache import quote_etag
+
+from recipes.models import IngredientRecipe, ShoppingCartRecipes
+
+CHUNK_SIZE = 2000
+
+
+def shopping_list_queryset(user):
+    """
+    Суммарное количество ингредиентов из рецептов в списке покупок:
+    словари с ключами name, measurement_unit и total.
+    """
+    return (IngredientRecipe.objects
+            .filter(recipe__recipe_in_cart__user=user)
+            .values('ingredient').annotate(total=Sum('amount'))
+            .values('total', name=F('ingredient__name'),
+                    measurement_unit=F('ingredient__measurement_unit'))
+            .order_by('ingredient__name'))
+
+
+def shopping_list_rows(user):
+    """
+    Строки списка покупок, читаемые серверным курсором
+    порциями по CHUNK_SIZE.
+    """
+    return shopping_list_queryset(user).iterator(chunk_size=CHUNK_SIZE)
+
+
+def ashopping_list_rows(user):
+    return shopping_list_queryset(user).aiterator(chunk_size=CHUNK_SIZE)
+
+
+STATE = {'count': Count('id'), 'last': Max('id'),
+         'modified': Max('recipe__modified')}
+
+
+def make_shopping_list_etag(list_format, state):
+    key = '{}:{count}:{last}:{modified}'.format(list_format, **state)
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+def shopping_list_etag(user, list_format):
+    """
+    ETag списка покупок без его построения: число и максимальный id
+    рецептов в списке покупок, как в viewer_state, и время последнего
+    изменения этих рецептов, включая их ингредиенты.
+    """
+    state = ShoppingCartRecipes.objects.filter(
+        user=user).aggregate(**STATE)
+    return make_shopping_list_etag(list_format, state)
+
+
+async def ashopping_list_etag(user, list_format):
+    return make_shopping_list_etag(
+        list_format, await ShoppingCartRecipes.objects.filter(
+            user=user).aaggregate(**STATE))
+
+
+class ShoppingListFormat:
+    """
+    Формат выгрузки списка покупок: заголовок, строка на ингредиент,
+    разделитель между строками и окончание. Строки отдаются по одной,
+    как из обычного, так и из асинхронного итератора.
+    """
+    def __init__(self, content_type, line, header='', separator='',
+                 footer=''):
+        self.content_type = content_type
+        self.line = line
+        self.header = header
+        self.separator = separator
+        self.footer = footer
+
+    def render(self, rows):
+        yield self.header
+        separator = ''
+        for row in rows:
+            yield separator + self.line(row)
+            separator = self.separator
+        yield self.footer
+
+    async def arender(self, rows):
+        yield self.header
+        separator = ''
+        async for row in rows:
+            yield separator + self.line(row)
+            separator = self.separator
+        yield self.footer
+
+
+class Echo:
+    """
+    Буфер для csv.writer, возвращающий записанную строку.
+    """
+    def write(self, value):
+        return value
+
+
+csv_writer = csv.writer(Echo())
+
+
+def txt_line(row):
+    return f'\n{row["name"]} ({row["measurement_unit"]}) - {row["total"]}'
+
+
+def csv_line(row):
+    return csv_writer.writerow(
+        (row['name'], row['measurement_unit'], row['total']))
+
+
+def json_line(row):
+    return json.dumps({'name': row['name'],
+                       'measurement_unit': row['measurement_unit'],
+                       'amount': row['total']}, ensure_ascii=False)
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ShoppingListFormat(
+        'text/plain; charset=utf-8', txt_line,
+        header='Ваш список покупок:\n-------------------',
+        footer='\n-------------------\nПриятных покупок!'),
+    'csv': ShoppingListFormat(
+        'text/csv; charset=utf-8', csv_line,
+        header=csv_writer.writerow(('name', 'measurement_unit', 'amount'))),
+    'json': ShoppingListFormat(
+        'application/json', json_line,
+        header='[', separator=',', footer=']'),
+}
@@ -0,0 +1,115 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import (FavoriteRecipe, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from users.models import FoodUser, Subscription
+
+from .conditional import RECIPES_VERSION_KEY
+from .ingredient_index import ingredient_index
+from .metrics import install_query_timer
+from .tag_cache import tag_cache
+from .versions import bump_version
+
+
+@receiver(connection_created)
+def time_connection_queries(connection, **kwargs):
+    install_query_timer(connection)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def rebuild_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tag_cache(instance, **kwargs):
+    tag_cache.invalidate()
+    touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def increment_favorites_count(instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1)
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def decrement_favorites_count(instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id, favorites_count__gt=0).update(
+        favorites_count=F('favorites_count') - 1)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(instance, created, **kwargs):
+    if created:
+        FoodUser.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(instance, **kwargs):
+    FoodUser.objects.filter(pk=instance.author_id, recipes_count__gt=0).update(
+        recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(instance, created, **kwargs):
+    if created:
+        FoodUser.objects.filter(pk=instance.subscription_id).update(
+            followers_count=F('followers_count') + 1)
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers_count(instance, **kwargs):
+    FoodUser.objects.filter(
+        pk=instance.subscription_id, followers_count__gt=0
+    ).update(followers_count=F('followers_count') - 1)
+
+
+def touch_recipes(recipes):
+    """
+    Отмечает рецепты измененными: обновляет modified и версию
+    выдачи рецептов, по которым строятся ETag.
+    """
+    recipes.update(modified=timezone.now())
+    bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipes(**kwargs):
+    bump_version(RECIPES_VERSION_KEY)
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def touch_ingredient_recipe(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(pk=instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_tagged_recipes(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif pk_set:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    else:
+        recipes = Recipe.objects.filter(tags=instance)
+    touch_recipes(recipes)
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_ingredient_recipes(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=FoodUser)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
@@ -0,0 +1,56 @@
+import threading
+
+from recipes.models import Tag
+
+from .versions import bump_version, get_version
+
+VERSION_KEY = 'tags:version'
+
+
+class TagCache:
+    """
+    Кеш сериализованного каталога тегов в памяти процесса.
+
+    Актуальность проверяется по ключу версии в общем кеше Django,
+    который меняется при сохранении и удалении тегов.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._tags = []
+        self._tags_by_id = {}
+
+    def version(self):
+        return get_version(VERSION_KEY)
+
+    def _load(self):
+        version = self.version()
+        if version != self._version:
+            from .serializers import TagSerializer
+
+            with self._lock:
+                tags = [dict(tag) for tag in
+                        TagSerializer(Tag.objects.all(), many=True).data]
+                self._tags = tags
+                self._tags_by_id = {tag['id']: tag for tag in tags}
+                self._version = version
+        return self._tags, self._tags_by_id
+
+    def all(self):
+        return self._load()[0]
+
+    def get(self, pk):
+        return self._load()[1].get(pk)
+
+    def mapping(self):
+        """
+        Словарь тегов по id. Версия проверяется один раз, поэтому
+        для нескольких тегов подряд лучше взять словарь, чем вызывать get.
+        """
+        return self._load()[1]
+
+    def invalidate(self):
+        bump_version(VERSION_KEY)
+
+
+tag_cache = TagCache()
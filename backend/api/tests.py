@@ -1,11 +1,41 @@
+import io
 import json
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock, skipUnless
 from django.contrib.auth.hashers import check_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError, connection, router, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 from rest_framework import status
 from rest_framework.authtoken.models import Token
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 
-from recipes.models import Tag, Ingredient
-from users.models import FoodUser
+from recipes.models import (Tag, Ingredient, Recipe, IngredientRecipe,
+                            FavoriteRecipe, ShoppingCartRecipes, FeedRecipe)
+from users.models import FoodUser, Subscription
+from backend.postgresql_pool.base import DatabaseWrapper, pool_gauges
+from api.feed import fan_out_recipe
+from api.fragments import fragment_cache
+from api.images import generate_image_variants
+from api.ingredient_index import build_index
+from api.metrics import registry
+from api.replicas import (PIN_COOKIE, ReplicaMiddleware, pin_key,
+                          request_routing, use_primary)
+from api.search import update_search_vector
+from api.tag_cache import tag_cache
+from api.versions import get_version
+from api.warmup import StartupReport, warm_up
+
+# Тесты, которые строят индекс ингредиентов, не трогают общий файл индекса.
+INDEX_DIR = tempfile.TemporaryDirectory()
+temporary_index = override_settings(
+    INGREDIENT_INDEX_PATH=os.path.join(INDEX_DIR.name, 'ingredients.idx'))
 
 
 class AccountCreationTests(APITestCase):
@@ -192,6 +222,83 @@ class AuthEndpointTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
 
+@override_settings(AUTH_TOKEN_TYPE='jwt')
+class StatelessTokenTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        data = {'email': 'test@test.com', 'password': 'testpassword123!'}
+        url = 'http://127.0.0.1:8000/api/auth/token/login/'
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.token = json.loads(response.content)['auth_token']
+
+    def test_jwt_login(self):
+        """
+        Проверяем, что токен подписан и не сохраняется в базе
+        """
+        self.assertEqual(self.token.count('.'), 2)
+        self.assertFalse(Token.objects.exists())
+
+    def test_jwt_authentication(self):
+        """
+        Проверяем аутентификацию без запроса токена и пользователя
+        """
+        url = 'http://127.0.0.1:8000/api/tags/'
+        for keyword in ('Token', 'Bearer'):
+            self.client.credentials(
+                HTTP_AUTHORIZATION=f'{keyword} {self.token}')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('users_fooduser' in query['sql']
+                                 or 'authtoken_token' in query['sql']
+                                 for query in queries))
+
+        response = self.client.get(
+            'http://127.0.0.1:8000/api/recipes/?is_favorited=1',
+            format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get('http://127.0.0.1:8000/api/users/me/',
+                                   format='json')
+        self.assertEqual(json.loads(response.content)['email'],
+                         self.user.email)
+
+    def test_invalid_jwt(self):
+        """
+        Проверяем отказ для испорченного токена
+        """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}x')
+        response = self.client.get('http://127.0.0.1:8000/api/users/me/',
+                                   format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_jwt_inactive_or_deleted_user(self):
+        """
+        Проверяем отказ в изменяющих запросах деактивированному
+        и удаленному пользователю
+        """
+        author = FoodUser.objects.create_user(
+            email='author@test.com', username='author',
+            first_name='author', last_name='author',
+            password='testpassword123!')
+        recipe = Recipe.objects.create(author=author, name='recipe',
+                                       text='test_text', cooking_time=10)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        url = f'http://127.0.0.1:8000/api/recipes/{recipe.id}/favorite/'
+        FoodUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.delete()
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(FavoriteRecipe.objects.exists())
+
+
 class TagsTests(APITestCase):
 
     def setUp(self):
@@ -244,6 +351,7 @@ class TagsTests(APITestCase):
                          self.tag_info['slug'])
 
 
+@temporary_index
 class IngrediendsTests(APITestCase):
     def setUp(self):
         self.ingrediend_info = {
@@ -310,3 +418,1250 @@ class IngrediendsTests(APITestCase):
                          self.ingrediend_info['name'])
         self.assertEqual(json.loads(response.content)['measurement_unit'],
                          self.ingrediend_info['measurement_unit'])
+
+
+class RecipeListTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.tag = Tag.objects.create(name='test_tag', color='#E26C2D',
+                                      slug='test_slug')
+        self.ingredient = Ingredient.objects.create(name='test_name',
+                                                    measurement_unit='g')
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'recipe_{number}',
+                text='test_text', cooking_time=10)
+            recipe.tags.add(self.tag)
+            IngredientRecipe.objects.create(recipe=recipe,
+                                            ingredient=self.ingredient,
+                                            amount=number + 1)
+        self.favorite = Recipe.objects.first()
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.favorite)
+        ShoppingCartRecipes.objects.create(user=self.user,
+                                           recipe=self.favorite)
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_flags(self):
+        """
+        Проверяем флаги is_favorited и is_in_shopping_cart в списке рецептов
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for recipe in json.loads(response.content)['results']:
+            expected = recipe['id'] == self.favorite.id
+            self.assertEqual(recipe['is_favorited'], expected)
+            self.assertEqual(recipe['is_in_shopping_cart'], expected)
+
+        response = self.client.get(url + '&is_favorited=1', format='json')
+        results = json.loads(response.content)['results']
+        self.assertEqual([recipe['id'] for recipe in results],
+                         [self.favorite.id])
+
+    def test_recipe_flags_anonymous(self):
+        """
+        Проверяем, что анонимный пользователь получает флаги False
+        """
+        self.client.force_authenticate(None)
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for recipe in json.loads(response.content)['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['is_in_shopping_cart'])
+
+        response = self.client.get(url + '&is_favorited=1', format='json')
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    def test_recipe_list_query_count(self):
+        """
+        Проверяем, что число запросов не зависит от размера страницы
+        """
+        author = FoodUser.objects.create_user(
+            email='author@test.com', username='author',
+            first_name='author', last_name='author',
+            password='testpassword123!')
+        Subscription.objects.create(user=self.user, subscription=author)
+        Recipe.objects.update(author=author)
+
+        url = 'http://127.0.0.1:8000/api/recipes/?limit='
+        self.client.get(url + '5', format='json')
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(url + '1', format='json')
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url + '5', format='json')
+        self.assertEqual(len(small_page), len(big_page))
+        for recipe in json.loads(response.content)['results']:
+            self.assertTrue(recipe['author']['is_subscribed'])
+
+    def test_recipe_list_query_count_cold_cache(self):
+        """
+        Проверяем, что без кеша фрагментов число запросов тоже
+        не зависит от размера страницы
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit='
+        self.client.get(url + '5', format='json')
+        fragment_cache().clear()
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(url + '1', format='json')
+        fragment_cache().clear()
+        with CaptureQueriesContext(connection) as big_page:
+            response = self.client.get(url + '5', format='json')
+        self.assertEqual(len(small_page), len(big_page))
+        for recipe in json.loads(response.content)['results']:
+            self.assertEqual(recipe['is_favorited'],
+                             recipe['id'] == self.favorite.id)
+
+    def test_recipe_fragment_cache(self):
+        """
+        Проверяем, что повторный список берется из кеша фрагментов,
+        а изменение ингредиента сбрасывает фрагменты его рецептов
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6'
+        self.client.get(url, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(len(json.loads(response.content)['results']), 5)
+        self.assertFalse(any('recipes_ingredientrecipe' in query['sql']
+                             for query in queries))
+
+        self.ingredient.name = 'new_name'
+        self.ingredient.save()
+        response = self.client.get(url, format='json')
+        for recipe in json.loads(response.content)['results']:
+            self.assertEqual(recipe['ingredients'][0]['name'], 'new_name')
+            self.assertEqual(recipe['is_favorited'],
+                             recipe['id'] == self.favorite.id)
+
+    def test_recipe_tags_filter(self):
+        """
+        Проверяем фильтр по тегам: любой из тегов и все теги
+        """
+        tag = Tag.objects.create(name='other_tag', color='#E26C2D',
+                                 slug='other_slug')
+        self.favorite.tags.add(tag)
+
+        url = ('http://127.0.0.1:8000/api/recipes/?limit=6'
+               '&tags=test_slug&tags=other_slug')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.json()['count'], 5)
+        response = self.client.get(url + '&tags_mode=all', format='json')
+        self.assertEqual([recipe['id'] for recipe in
+                          response.json()['results']], [self.favorite.id])
+        response = self.client.get(url + '&tags=unknown&tags_mode=all',
+                                   format='json')
+        self.assertEqual(response.json()['count'], 0)
+
+    def test_recipe_search(self):
+        """
+        Проверяем поиск рецептов по query-параметру search
+        """
+        recipe = Recipe.objects.create(
+            author=self.user, name='Борщ', text='Красный суп',
+            cooking_time=60)
+        IngredientRecipe.objects.create(recipe=recipe,
+                                        ingredient=self.ingredient,
+                                        amount=1)
+        update_search_vector(recipe)
+
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6&search=Борщ'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.json()['results']],
+                         [recipe.id])
+
+    def test_favorite_twice(self):
+        """
+        Проверяем, что повторное добавление в избранное возвращает 400
+        """
+        url = (f'http://127.0.0.1:8000/api/recipes/{self.favorite.id}'
+               '/favorite/')
+        response = self.client.post(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(FavoriteRecipe.objects.count(), 1)
+
+    def test_favorite_delete(self):
+        """
+        Проверяем, что ответ 204 на удаление из избранного без тела
+        """
+        url = (f'http://127.0.0.1:8000/api/recipes/{self.favorite.id}'
+               '/favorite/')
+        response = self.client.delete(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(FavoriteRecipe.objects.count(), 0)
+
+    def test_hot_query_plans(self):
+        """
+        Проверяем, что горячие запросы используют составные индексы
+        """
+        call_command('check_query_plans', stdout=io.StringIO())
+
+    def test_counters(self):
+        """
+        Проверяем счетчики избранного и рецептов и их сверку
+        """
+        self.favorite.refresh_from_db()
+        self.user.refresh_from_db()
+        self.assertEqual(self.favorite.favorites_count, 1)
+        self.assertEqual(self.user.recipes_count, 5)
+
+        FavoriteRecipe.objects.all().delete()
+        self.favorite.delete()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 4)
+
+        Recipe.objects.update(favorites_count=10)
+        FoodUser.objects.update(recipes_count=0)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertFalse(Recipe.objects.exclude(favorites_count=0).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 4)
+
+    def test_recipe_list_not_modified(self):
+        """
+        Проверяем ответ 304 для неизменившегося списка рецептов
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6'
+        etag = self.client.get(url, format='json')['ETag']
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        FavoriteRecipe.objects.all().delete()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = response['ETag']
+        Recipe.objects.first().save()
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_recipe_detail_not_modified(self):
+        """
+        Проверяем ETag и Last-Modified для рецепта
+        """
+        url = f'http://127.0.0.1:8000/api/recipes/{self.favorite.id}/'
+        etag = self.client.get(url, format='json')['ETag']
+        response = self.client.get(url, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.force_authenticate(None)
+        last_modified = self.client.get(url, format='json')['Last-Modified']
+        response = self.client.get(url, format='json',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_recipe_detail_bad_id(self):
+        """
+        Проверяем ответ 404 для нечислового id рецепта
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/abc/'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SubscriptionTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        for number in range(3):
+            author = FoodUser.objects.create_user(
+                email=f'author{number}@test.com', username=f'author{number}',
+                first_name='author', last_name='author',
+                password='testpassword123!')
+            Subscription.objects.create(user=self.user, subscription=author)
+            for recipe_number in range(number + 2):
+                Recipe.objects.create(
+                    author=author, name=f'recipe_{recipe_number}',
+                    text='test_text', cooking_time=10)
+        self.client.force_authenticate(self.user)
+
+    def test_subscriptions_recipes_limit(self):
+        """
+        Проверяем recipes_limit и recipes_count в списке подписок
+        """
+        url = ('http://127.0.0.1:8000/api/users/subscriptions/'
+               '?limit=10&recipes_limit=2')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(queries), 3)
+        for author in json.loads(response.content)['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'],
+                             Recipe.objects.filter(author=author['id'])
+                             .count())
+
+    def test_subscriptions_without_recipes_limit(self):
+        """
+        Проверяем, что без recipes_limit выводятся все рецепты
+        """
+        url = 'http://127.0.0.1:8000/api/users/subscriptions/?limit=10'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for author in json.loads(response.content)['results']:
+            self.assertEqual(len(author['recipes']), author['recipes_count'])
+
+
+class ShoppingListTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.ingredient = Ingredient.objects.create(name='test_name',
+                                                    measurement_unit='g')
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=self.user, name=f'recipe_{number}',
+                text='test_text', cooking_time=10)
+            IngredientRecipe.objects.create(recipe=recipe,
+                                            ingredient=self.ingredient,
+                                            amount=number + 1)
+            ShoppingCartRecipes.objects.create(user=self.user, recipe=recipe)
+        self.client.force_authenticate(self.user)
+        self.url = 'http://127.0.0.1:8000/api/recipes/download_shopping_cart/'
+
+    def download(self, url, **headers):
+        response = self.client.get(url, **headers)
+        content = b''.join(getattr(response, 'streaming_content', []))
+        return response, content.decode()
+
+    def test_download_formats(self):
+        """
+        Проверяем выгрузку списка покупок в txt, csv и json
+        """
+        response, content = self.download(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('test_name (g) - 3', content)
+
+        response, content = self.download(self.url + '?format=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(content.splitlines(),
+                         ['name,measurement_unit,amount', 'test_name,g,3'])
+
+        response, content = self.download(self.url + '?format=json')
+        self.assertEqual(json.loads(content), [
+            {'name': 'test_name', 'measurement_unit': 'g', 'amount': 3}])
+
+    def test_download_not_modified(self):
+        """
+        Проверяем ответ 304 для неизменившегося списка покупок
+        """
+        response, _ = self.download(self.url)
+        etag = response['ETag']
+        response, _ = self.download(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        ShoppingCartRecipes.objects.first().delete()
+        response, _ = self.download(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_download_etag_changes(self):
+        """
+        Проверяем, что ETag меняется при замене рецепта в списке покупок
+        и переименовании ингредиента
+        """
+        recipe = Recipe.objects.create(author=self.user, name='recipe_2',
+                                       text='test_text', cooking_time=10)
+        IngredientRecipe.objects.create(
+            recipe=recipe, amount=1, ingredient=Ingredient.objects.create(
+                name='pepper', measurement_unit='g'))
+        etag = self.download(self.url)[0]['ETag']
+
+        ShoppingCartRecipes.objects.filter(recipe__name='recipe_0').delete()
+        ShoppingCartRecipes.objects.create(user=self.user, recipe=recipe)
+        response, content = self.download(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('pepper (g) - 1', content)
+
+        etag = response['ETag']
+        self.ingredient.name = 'salt'
+        self.ingredient.save()
+        response, content = self.download(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('salt (g) - 2', content)
+
+
+class IngredientIndexTests(APITestCase):
+
+    def setUp(self):
+        self.index_dir = tempfile.TemporaryDirectory()
+        self.index_settings = override_settings(
+            INGREDIENT_INDEX_PATH=os.path.join(self.index_dir.name,
+                                               'ingredients.idx'))
+        self.index_settings.enable()
+        for name in ('Абрикос', 'абрикосовый джем', 'банан', 'Apple'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        build_index()
+
+    def tearDown(self):
+        self.index_settings.disable()
+        self.index_dir.cleanup()
+
+    def test_prefix_search(self):
+        """
+        Проверяем поиск по началу имени без учета регистра
+        """
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=АБРИК'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['Абрикос', 'абрикосовый джем'])
+
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=fake'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.json(), [])
+
+    def test_index_rebuild_on_change(self):
+        """
+        Проверяем перестроение индекса при изменении ингредиентов
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='банановое пюре',
+                                      measurement_unit='г')
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=бан'
+        response = self.client.get(url, format='json')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['банан', 'банановое пюре'])
+
+    def test_index_rebuild_stale_version(self):
+        """
+        Проверяем, что индекс со старой версией каталога строится заново
+        """
+        Ingredient.objects.create(name='банановое пюре', measurement_unit='г')
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=бан'
+        response = self.client.get(url, format='json')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['банан', 'банановое пюре'])
+
+    def test_index_rebuild_foreign_file(self):
+        """
+        Проверяем, что файл без заголовка индекса строится заново
+        """
+        path = os.path.join(self.index_dir.name, 'ingredients.idx')
+        with open(path, 'wb') as index_file:
+            index_file.write(b'FGI1' + bytes(64))
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=бан'
+        response = self.client.get(url, format='json')
+        self.assertEqual([item['name'] for item in response.json()],
+                         ['банан'])
+
+
+class IngredientImportTests(APITestCase):
+
+    def setUp(self):
+        self.data_dir = tempfile.TemporaryDirectory()
+        self.index_settings = override_settings(
+            INGREDIENT_INDEX_PATH=os.path.join(self.data_dir.name,
+                                               'ingredients.idx'))
+        self.index_settings.enable()
+
+    def tearDown(self):
+        self.index_settings.disable()
+        self.data_dir.cleanup()
+
+    def test_import_is_idempotent(self):
+        """
+        Проверяем, что повторная загрузка не создает дубликатов
+        """
+        path = os.path.join(self.data_dir.name, 'ingredients.csv')
+        with open(path, 'w', encoding='utf-8') as source:
+            source.write('соль,г\nсахар,г\nсоль,г\n')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+
+        for _ in range(2):
+            call_command('ing_import', path, stdout=io.StringIO())
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['сахар', 'соль'])
+
+
+class TagCacheTests(APITestCase):
+
+    def test_tag_cache_invalidation(self):
+        """
+        Проверяем, что кеш тегов обновляется при изменении тега
+        """
+        tag = Tag.objects.create(name='test_tag', color='#E26C2D',
+                                 slug='test_slug')
+        url = 'http://127.0.0.1:8000/api/tags/'
+        self.client.get(url, format='json')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, format='json')
+        self.assertEqual(len(queries), 0)
+
+        tag.name = 'new_name'
+        tag.save()
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.json()[0]['name'], 'new_name')
+
+        response = self.client.get(url + '100/', format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tag_list_not_modified(self):
+        """
+        Проверяем ответ 304 для неизменившегося списка тегов
+        """
+        Tag.objects.create(name='test_tag', color='#E26C2D',
+                           slug='test_slug')
+        url = 'http://127.0.0.1:8000/api/tags/'
+        etag = self.client.get(url, format='json')['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, format='json',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+
+    def test_recipe_tags_version_reads(self):
+        """
+        Проверяем, что версия тегов читается один раз на страницу рецептов
+        """
+        tag = Tag.objects.create(name='test_tag', color='#E26C2D',
+                                 slug='test_slug')
+        author = FoodUser.objects.create_user(
+            email='author@test.com', username='author',
+            first_name='author', last_name='author',
+            password='testpassword123!')
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=author, name=f'recipe_{number}',
+                text='test_text', cooking_time=10)
+            recipe.tags.add(tag)
+
+        url = 'http://127.0.0.1:8000/api/recipes/?limit='
+        reads = []
+        for limit in ('1', '3'):
+            fragment_cache().clear()
+            with mock.patch('api.tag_cache.get_version',
+                            wraps=get_version) as version:
+                response = self.client.get(url + limit, format='json')
+            reads.append(version.call_count)
+        self.assertEqual(reads[0], reads[1])
+        for recipe in response.json()['results']:
+            self.assertEqual(recipe['tags'][0]['slug'], 'test_slug')
+
+
+class CursorPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.recipes = [
+            Recipe.objects.create(author=self.user, name=f'recipe_{number}',
+                                  text='test_text', cooking_time=10)
+            for number in range(5)]
+
+    def test_cursor_pages(self):
+        """
+        Проверяем обход рецептов по cursor без запроса COUNT
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=2&cursor='
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(any('COUNT(' in query['sql']
+                                 for query in queries))
+            content = response.json()
+            self.assertNotIn('count', content)
+            ids += [recipe['id'] for recipe in content['results']]
+            url = content['next']
+        self.assertEqual(ids, [recipe.id for recipe in reversed(self.recipes)])
+
+    def test_cursor_with_search(self):
+        """
+        Проверяем, что cursor нельзя совместить с поиском по релевантности
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=2&cursor=&search=rec'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', response.json())
+
+
+class ImageVariantsTests(APITestCase):
+
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.media_settings = override_settings(MEDIA_ROOT=self.media_dir.name)
+        self.media_settings.enable()
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        image = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(image, 'JPEG')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='test_text',
+            cooking_time=10,
+            image=ContentFile(image.getvalue(), name='big.jpeg'))
+
+    def tearDown(self):
+        self.media_settings.disable()
+        self.media_dir.cleanup()
+
+    def test_image_variants(self):
+        """
+        Проверяем создание уменьшенных копий картинки рецепта
+        """
+        generate_image_variants(self.recipe.id)
+        url = f'http://127.0.0.1:8000/api/recipes/{self.recipe.id}/'
+        response = self.client.get(url, format='json')
+        variants = response.json()['image_variants']
+        self.assertTrue(variants['placeholder'].startswith(
+            'data:image/jpeg;base64,'))
+        self.assertEqual(sorted(variants['sizes'], key=int),
+                         ['320', '640', '1280'])
+        self.recipe.refresh_from_db()
+        name = self.recipe.image_variants['sizes']['320']['webp']
+        with Image.open(os.path.join(self.media_dir.name, name)) as image:
+            self.assertEqual(image.size, (320, 160))
+
+
+class FeedTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.authors = [
+            FoodUser.objects.create_user(
+                email=f'author{number}@test.com', username=f'author{number}',
+                first_name='author', last_name='author',
+                password='testpassword123!')
+            for number in range(2)]
+        self.old_recipe = Recipe.objects.create(
+            author=self.authors[0], name='old', text='test_text',
+            cooking_time=10)
+        self.client.force_authenticate(self.user)
+        for author in self.authors:
+            self.client.post(
+                f'http://127.0.0.1:8000/api/users/{author.id}/subscribe/')
+
+    def publish(self, author):
+        author.refresh_from_db()
+        recipe = Recipe.objects.create(author=author, name='new',
+                                       text='test_text', cooking_time=10)
+        fan_out_recipe(recipe)
+        return recipe
+
+    def feed_ids(self):
+        url = 'http://127.0.0.1:8000/api/users/feed/?limit=10'
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_feed_fan_out_on_write(self):
+        """
+        Проверяем ленту: старые рецепты при подписке и новые при публикации
+        """
+        new_recipe = self.publish(self.authors[1])
+        self.assertEqual(self.feed_ids(), [new_recipe.id, self.old_recipe.id])
+        self.assertEqual(FeedRecipe.objects.filter(user=self.user).count(), 2)
+
+        self.client.delete(
+            f'http://127.0.0.1:8000/api/users/{self.authors[0].id}'
+            '/subscribe/')
+        self.assertEqual(self.feed_ids(), [new_recipe.id])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_feed_fan_out_on_read(self):
+        """
+        Проверяем, что рецепты популярных авторов подмешиваются при чтении
+        """
+        new_recipe = self.publish(self.authors[1])
+        self.assertFalse(FeedRecipe.objects.filter(recipe=new_recipe).exists())
+        self.assertEqual(self.feed_ids(), [new_recipe.id, self.old_recipe.id])
+
+
+class BulkEndpointsTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.author = FoodUser.objects.create_user(
+            email='author@test.com', username='author',
+            first_name='author', last_name='author',
+            password='testpassword123!')
+        self.recipes = [
+            Recipe.objects.create(author=self.author, name=f'recipe_{number}',
+                                  text='test_text', cooking_time=10)
+            for number in range(3)]
+        self.client.force_authenticate(self.user)
+
+    def statuses(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['status'] for item in response.json()['results']]
+
+    def test_bulk_favorite(self):
+        """
+        Проверяем массовое добавление и удаление избранного и счетчики
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/favorite/'
+        ids = [self.recipes[0].id, self.recipes[1].id, 999]
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipes[0])
+
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(self.statuses(response),
+                         ['exists', 'created', 'not_found'])
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk').values_list(
+                'favorites_count', flat=True)), [1, 1, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(url, {'ids': ids}, format='json')
+        self.assertEqual(self.statuses(response),
+                         ['deleted', 'deleted', 'not_found'])
+        self.assertFalse(FavoriteRecipe.objects.exists())
+        self.assertFalse(Recipe.objects.filter(favorites_count__gt=0).exists())
+        self.assertEqual(
+            [query['sql'].split()[0] for query in queries
+             if 'recipes_favoriterecipe' in query['sql']
+             or query['sql'].startswith('UPDATE')],
+            ['SELECT', 'DELETE', 'UPDATE'])
+
+    def test_bulk_shopping_cart(self):
+        """
+        Проверяем массовое добавление в список покупок одним запросом
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/shopping_cart/'
+        ids = [recipe.id for recipe in self.recipes]
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(self.statuses(response), ['created'] * 3)
+        self.assertEqual(ShoppingCartRecipes.objects.count(), 3)
+
+        response = self.client.post(url, {'ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_subscribe(self):
+        """
+        Проверяем массовую подписку, счетчик подписчиков и ленту
+        """
+        url = 'http://127.0.0.1:8000/api/users/subscribe/'
+        ids = [self.author.id, self.user.id]
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(self.statuses(response), ['created', 'not_found'])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(FeedRecipe.objects.filter(user=self.user).count(), 3)
+
+        response = self.client.delete(url, {'ids': ids}, format='json')
+        self.assertEqual(self.statuses(response), ['deleted', 'not_found'])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertFalse(FeedRecipe.objects.exists())
+
+
+class RecipeWriteTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.tag = Tag.objects.create(name='test_tag', color='#E26C2D',
+                                      slug='test_slug')
+        self.ingredients = [
+            Ingredient.objects.create(name=f'ingredient_{number}',
+                                      measurement_unit='g')
+            for number in range(4)]
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='test_text',
+            cooking_time=10)
+        self.recipe.tags.add(self.tag)
+        for ingredient in self.ingredients[:3]:
+            IngredientRecipe.objects.create(recipe=self.recipe,
+                                            ingredient=ingredient, amount=1)
+        self.url = f'http://127.0.0.1:8000/api/recipes/{self.recipe.id}/'
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_ingredients_diff(self):
+        """
+        Проверяем, что при изменении рецепта не пересоздаются
+        неизменившиеся строки ингредиентов
+        """
+        kept = IngredientRecipe.objects.get(ingredient=self.ingredients[0])
+        data = {
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 1},
+                {'id': self.ingredients[1].id, 'amount': 5},
+                {'id': self.ingredients[3].id, 'amount': 2},
+            ],
+        }
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            dict(self.recipe.recipe_ingredient.values_list(
+                'ingredient_id', 'amount')),
+            {self.ingredients[0].id: 1, self.ingredients[1].id: 5,
+             self.ingredients[3].id: 2})
+        self.assertTrue(IngredientRecipe.objects.filter(pk=kept.pk).exists())
+        self.assertEqual(
+            {ing['id']: ing['amount']
+             for ing in response.json()['ingredients']},
+            {self.ingredients[0].id: 1, self.ingredients[1].id: 5,
+             self.ingredients[3].id: 2})
+
+    def test_recipe_ingredients_removed_once(self):
+        """
+        Проверяем, что удаленные ингредиенты удаляются одним запросом
+        и рецепт не отмечается измененным по каждой строке
+        """
+        modified = self.recipe.modified
+        data = {'ingredients': [{'id': self.ingredients[3].id, 'amount': 2}]}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([ing['id'] for ing in response.json()['ingredients']],
+                         [self.ingredients[3].id])
+        statements = [query['sql'] for query in queries]
+        self.assertEqual(
+            len([sql for sql in statements if sql.startswith('DELETE')]), 1)
+        self.assertFalse(any(sql.startswith(
+            'UPDATE "recipes_recipe" SET "modified"') for sql in statements))
+        self.recipe.refresh_from_db()
+        self.assertGreater(self.recipe.modified, modified)
+
+    def test_recipe_unknown_ingredient(self):
+        """
+        Проверяем, что несуществующий ингредиент не меняет рецепт
+        """
+        data = {'ingredients': [{'id': self.ingredients[3].id, 'amount': 1},
+                                {'id': 999, 'amount': 1}]}
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.recipe.recipe_ingredient.count(), 3)
+
+    def test_recipe_update_flags(self):
+        """
+        Проверяем флаги пользователя в ответе на изменение рецепта
+        """
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.patch(self.url, {'name': 'renamed'},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.json()['is_favorited'])
+        self.assertFalse(response.json()['is_in_shopping_cart'])
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.metrics_dir.cleanup)
+        self.metrics_settings = override_settings(
+            METRICS_DIR=self.metrics_dir.name)
+        self.metrics_settings.enable()
+        self.addCleanup(self.metrics_settings.disable)
+
+    def test_metrics_endpoint(self):
+        """
+        Проверяем, что запросы к API попадают в метрики
+        """
+        self.client.get('http://127.0.0.1:8000/api/recipes/?limit=6')
+        url = 'http://127.0.0.1:8000/api/internal/metrics/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = response.content.decode()
+        self.assertIn('foodgram_http_db_queries_count{view="recipe-list",'
+                      'method="GET",status="200"}', metrics)
+        self.assertIn('foodgram_http_request_duration_seconds_bucket{'
+                      'view="recipe-list",method="GET",status="200",'
+                      'le="+Inf"}', metrics)
+
+    @override_settings(ROOT_URLCONF='backend.urls_async')
+    async def test_metrics_async_queries(self):
+        """
+        Проверяем, что SQL-запросы асинхронных view попадают в метрики
+        """
+        labels = (('view', 'recipe-list'), ('method', 'GET'),
+                  ('status', 200))
+        queries = registry.histograms['foodgram_http_db_queries']
+        seconds = registry.counters['foodgram_http_db_seconds_total']
+        queries_before = queries.get(labels, [0, 0])[-2]
+        seconds_before = seconds.get(labels, 0)
+        url = 'http://127.0.0.1:8000/api/recipes/?limit=6'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(queries[labels][-2], queries_before)
+        self.assertGreater(seconds[labels], seconds_before)
+
+    def test_metrics_gauges(self):
+        """
+        Проверяем, что значения gauge-метрик читаются при снимке
+        """
+        def gauges():
+            yield ('foodgram_db_pool_size', (('alias', 'test'),)), 3
+
+        registry.add_gauges(gauges)
+        self.addCleanup(registry.gauge_callbacks.remove, gauges)
+        url = 'http://127.0.0.1:8000/api/internal/metrics/'
+        metrics = self.client.get(url).content.decode()
+        self.assertIn('# TYPE foodgram_db_pool_size gauge', metrics)
+        self.assertIn('foodgram_db_pool_size{alias="test"} 3', metrics)
+
+    def test_metrics_not_inherited(self):
+        """
+        Проверяем, что процесс после fork не получает метрики родителя
+        """
+        labels = (('alias', 'test'),)
+        registry.inc('foodgram_db_pool_timeouts_total', labels)
+        self.addCleanup(
+            registry.counters['foodgram_db_pool_timeouts_total'].pop,
+            labels)
+        child = os.fork()
+        if child == 0:
+            os._exit(0 if not registry.snapshot()['counters'][
+                'foodgram_db_pool_timeouts_total'] else 1)
+        _, exit_status = os.waitpid(child, 0)
+        self.assertEqual(exit_status, 0)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_allowlist(self):
+        """
+        Проверяем, что метрики закрыты для адресов вне списка
+        """
+        url = 'http://127.0.0.1:8000/api/internal/metrics/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Пул соединений есть только у PostgreSQL')
+class ConnectionPoolTests(APITestCase):
+
+    def setUp(self):
+        self.settings_dict = {
+            **connection.settings_dict,
+            'ENGINE': 'backend.postgresql_pool',
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': {'min_size': 1, 'max_size': 1,
+                                 'timeout': 0.5}},
+        }
+        self.wrapper = DatabaseWrapper(self.settings_dict, alias='pool_test')
+        self.addCleanup(self.wrapper.close_pool)
+
+    def backend_pid(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_reused(self):
+        """
+        Проверяем, что закрытое соединение возвращается в пул
+        и выдается снова
+        """
+        pid = self.backend_pid(self.wrapper)
+        self.wrapper.close()
+        self.assertEqual(self.backend_pid(self.wrapper), pid)
+        self.assertIn(
+            (('foodgram_db_pool_size', (('alias', 'pool_test'),)), 1),
+            list(pool_gauges()))
+
+    def test_pool_timeout(self):
+        """
+        Проверяем ошибку и метрику, когда свободных соединений нет
+        """
+        self.backend_pid(self.wrapper)
+        labels = (('alias', 'pool_test'),)
+        timeouts = registry.counters['foodgram_db_pool_timeouts_total']
+        before = timeouts.get(labels, 0)
+        other = DatabaseWrapper(self.settings_dict, alias='pool_test')
+        with self.assertRaises(OperationalError):
+            other.ensure_connection()
+        self.assertEqual(timeouts[labels], before + 1)
+
+    def test_pool_not_inherited(self):
+        """
+        Проверяем, что процесс после fork не использует пул родителя
+        """
+        self.backend_pid(self.wrapper)
+        self.wrapper.close()
+        pool = self.wrapper.pool
+        child = os.fork()
+        if child == 0:
+            os._exit(0 if self.wrapper.pool is not pool else 1)
+        _, exit_status = os.waitpid(child, 0)
+        self.assertEqual(exit_status, 0)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(APITransactionTestCase):
+
+    def test_read_routing(self):
+        """
+        Проверяем, какие чтения уходят в реплику
+        """
+        self.assertEqual(Recipe.objects.all().db, 'default')
+        with request_routing():
+            self.assertEqual(Recipe.objects.all().db, 'replica')
+            with transaction.atomic():
+                self.assertEqual(Recipe.objects.all().db, 'default')
+            self.assertEqual(router.db_for_write(Recipe), 'default')
+            self.assertEqual(Recipe.objects.all().db, 'default')
+        with request_routing():
+            self.assertTrue(use_primary())
+            self.assertFalse(use_primary())
+            self.assertEqual(Recipe.objects.all().db, 'default')
+        with request_routing(pinned=True):
+            self.assertEqual(Tag.objects.all().db, 'default')
+
+    @override_settings(DATABASE_REPLICAS=[f'replica_{number}'
+                                          for number in range(10)])
+    def test_one_replica_per_request(self):
+        """
+        Проверяем, что все чтения запроса уходят в одну реплику
+        """
+        with request_routing() as routing:
+            self.assertEqual(
+                {Recipe.objects.all().db for _ in range(20)},
+                {routing.replica})
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaPinTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='recipe', text='test_text',
+            cooking_time=10)
+        self.authorization = f'Token {Token.objects.create(user=self.user)}'
+        self.client.credentials(HTTP_AUTHORIZATION=self.authorization)
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(lambda request: None)
+
+    def test_pin_after_write(self):
+        """
+        Проверяем, что после записи клиент читает из основной базы
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/'
+        response = self.client.get(url)
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+        response = self.client.post(f'{url}{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+        request = self.factory.get(url,
+                                   HTTP_AUTHORIZATION=self.authorization)
+        self.addCleanup(cache.delete, pin_key(request))
+        self.assertTrue(self.middleware.is_pinned(request))
+
+        self.assertFalse(self.middleware.is_pinned(self.factory.get(url)))
+        self.assertTrue(self.middleware.is_pinned(self.factory.post(url)))
+        self.factory.cookies[PIN_COOKIE] = '1'
+        self.assertTrue(self.middleware.is_pinned(self.factory.get(url)))
+
+
+@temporary_index
+class BenchmarkTests(APITransactionTestCase):
+    databases = '__all__'
+
+    def test_seed_and_benchmark(self):
+        """
+        Проверяем генерацию данных и замер эндпоинтов на ней
+        """
+        call_command('seed_data', users=10, recipes=30,
+                     stdout=io.StringIO())
+        self.assertEqual(Recipe.objects.count(), 30)
+        self.assertFalse(
+            Recipe.objects.filter(recipe_ingredient=None).exists())
+        for recipe in Recipe.objects.all():
+            self.assertEqual(recipe.favorites_count,
+                             recipe.recipe_in_favorite.count())
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark', requests=2, warmup=0, output=output,
+                         stdout=io.StringIO())
+            with open(output) as report:
+                endpoints = json.load(report)['endpoints']
+            for name, result in endpoints.items():
+                self.assertEqual(result['status'], status.HTTP_200_OK, name)
+
+            call_command('benchmark', requests=2, warmup=1,
+                         endpoint=['tags'], baseline=output, threshold=100,
+                         stdout=io.StringIO())
+
+
+@temporary_index
+class StartupWarmUpTests(APITestCase):
+
+    def test_warm_up(self):
+        """
+        Проверяем, что прогрев загружает каталог тегов и пишет отчет
+        """
+        Tag.objects.create(name='tag', color='#E26C2D', slug='tag')
+        report = StartupReport()
+        warm_up(report)
+        self.assertEqual(
+            [name for name, _, _ in report.phases],
+            ['urlconf', 'translations', 'serializers', 'tags',
+             'ingredient index'])
+        self.assertIn('ingredient index', report.format())
+        with self.assertNumQueries(0):
+            self.assertEqual(tag_cache.all()[0]['slug'], 'tag')
+
+    def test_warm_up_without_database(self):
+        """
+        Проверяем, что недоступная база не прерывает прогрев
+        и попадает в отчет
+        """
+        report = StartupReport()
+        with mock.patch.object(tag_cache, 'all', side_effect=OperationalError(
+                'connection refused')):
+            warm_up(report)
+        self.assertEqual(
+            [name for name, _, _ in report.phases],
+            ['urlconf', 'translations', 'serializers', 'tags'])
+        self.assertEqual(list(report.failures), ['tags'])
+        self.assertIn('ошибка: connection refused', report.format())
+
+
+@temporary_index
+class SyncAsyncParityTests(APITestCase):
+
+    def setUp(self):
+        self.user = FoodUser.objects.create_user(
+            email='test@test.com', username='testname',
+            first_name='test_first_name', last_name='test_last_name',
+            password='testpassword123!')
+        self.author = FoodUser.objects.create_user(
+            email='author@test.com', username='author',
+            first_name='author', last_name='author',
+            password='testpassword123!')
+        self.tag = Tag.objects.create(name='tag', color='#E26C2D',
+                                      slug='tag')
+        self.ingredient = Ingredient.objects.create(
+            name='ingredient', measurement_unit='g')
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'recipe_{number}',
+                text='test_text', cooking_time=10)
+            recipe.tags.add(self.tag)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=number + 1)
+        self.recipe = recipe
+        FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+        ShoppingCartRecipes.objects.create(user=self.user, recipe=recipe)
+        Subscription.objects.create(user=self.user, subscription=self.author)
+        self.token = Token.objects.create(user=self.user)
+
+    def get_both(self, url):
+        sync_response = self.client.get(url)
+        with override_settings(ROOT_URLCONF='backend.urls_async'):
+            async_response = self.client.get(url)
+        self.assertEqual(async_response.status_code,
+                         sync_response.status_code, url)
+        return sync_response, async_response
+
+    def assertSameResponses(self, urls):
+        for url in urls:
+            sync_response, async_response = self.get_both(url)
+            if sync_response.streaming and async_response.streaming:
+                self.assertEqual(b''.join(async_response),
+                                 b''.join(sync_response), url)
+            else:
+                self.assertEqual(async_response.content,
+                                 sync_response.content, url)
+
+    def test_async_views_match_sync(self):
+        """
+        Проверяем, что асинхронные view отдают те же ответы, что и DRF
+        """
+        base = 'http://127.0.0.1:8000/api/'
+        urls = [
+            f'{base}recipes/',
+            f'{base}recipes/?limit=2',
+            f'{base}recipes/?limit=2&page=2',
+            f'{base}recipes/?limit=2&page=9',
+            f'{base}recipes/?tags=tag&author={self.author.id}',
+            f'{base}recipes/?cursor=&search=recipe',
+            f'{base}recipes/{self.recipe.id}/',
+            f'{base}recipes/999/',
+            f'{base}ingredients/',
+            f'{base}ingredients/?name=ingr',
+            f'{base}ingredients/{self.ingredient.id}/',
+            f'{base}tags/',
+            f'{base}tags/{self.tag.id}/',
+            f'{base}tags/999/',
+        ]
+        self.assertSameResponses(urls)
+        self.assertSameResponses([f'{base}recipes/download_shopping_cart/'])
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertSameResponses(urls + [
+            f'{base}recipes/?is_favorited=1',
+            f'{base}recipes/?is_in_shopping_cart=1&limit=1',
+            f'{base}recipes/download_shopping_cart/',
+            f'{base}recipes/download_shopping_cart/?format=csv',
+            f'{base}recipes/download_shopping_cart/?format=json',
+        ])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        self.assertSameResponses([f'{base}recipes/', f'{base}tags/'])
+
+    @override_settings(ROOT_URLCONF='backend.urls_async')
+    def test_async_views_conditional_and_fallback(self):
+        """
+        Проверяем ответ 304 асинхронных view и передачу записи
+        и курсорной пагинации синхронным view
+        """
+        url = 'http://127.0.0.1:8000/api/recipes/'
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Allow'], 'GET, POST, HEAD, OPTIONS')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        detail_url = f'{url}{self.recipe.id}/'
+        etag = self.client.get(detail_url)['ETag']
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(detail_url, {'cooking_time': 20},
+                                     format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.force_authenticate(None)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['cooking_time'], 20)
+
+        response = self.client.get(f'{url}?cursor=&limit=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('next', response.json())
+        self.assertNotIn('count', response.json())
+
+    @override_settings(ROOT_URLCONF='backend.urls_async')
+    def test_async_ingredient_search_builds_index(self):
+        """
+        Проверяем, что асинхронный поиск ингредиентов сам строит
+        отсутствующий или устаревший индекс
+        """
+        url = 'http://127.0.0.1:8000/api/ingredients/?name=ingr'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.json()],
+                         [self.ingredient.id])
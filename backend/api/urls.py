@@ -1,9 +1,13 @@
 from django.urls import path, include
 from rest_framework import routers
 
+from .metrics import metrics_view
+
 from .views import (TagViewSet, IngredientViewSet,
                     RecipeViewSet, TokenCreateView, FoodUserView,
-                    FavoriteViewSet, ShoppingCartViewSet)
+                    FavoriteViewSet, ShoppingCartViewSet,
+                    DownloadShoppingCartView, BulkFavoriteView,
+                    BulkShoppingCartView)
 
 
 router = routers.DefaultRouter()
@@ -22,8 +26,15 @@ urlpatterns = [
     path('api/recipes/<int:id>/shopping_cart/',
          ShoppingCartViewSet.as_view(),
          name='shopping_cart'),
+    path('api/recipes/favorite/',
+         BulkFavoriteView.as_view(),
+         name='favorite-bulk'),
+    path('api/recipes/shopping_cart/',
+         BulkShoppingCartView.as_view(),
+         name='shopping_cart-bulk'),
     path('api/recipes/download_shopping_cart/',
-         ShoppingCartViewSet.as_view(),
+         DownloadShoppingCartView.as_view(),
          name='download'),
+    path('api/internal/metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,24 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_version(key):
+    """
+    Текущая версия данных по ключу в общем кеше Django.
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    """
+    Меняет версию сразу и повторно после коммита, чтобы другие процессы
+    не закешировали данные, прочитанные до коммита.
+    """
+    cache.set(key, uuid.uuid4().hex, None)
+    transaction.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
@@ -1,30 +1,51 @@
 from djoser import utils
 from djoser.conf import settings
 from djoser.views import UserViewSet
-from django.http import HttpResponse
-from django.db.models import Sum
+from django.conf import settings as django_settings
+from django.contrib.auth.signals import user_logged_in
+from django.http import StreamingHttpResponse
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from django.db.models.functions import RowNumber
 from rest_framework import (generics, status, viewsets,
                             permissions)
 from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework_simplejwt.tokens import AccessToken
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 
 from users.models import FoodUser, Subscription
 from recipes.models import (Tag, Ingredient, Recipe, FavoriteRecipe,
-                            ShoppingCartRecipes, IngredientRecipe)
+                            ShoppingCartRecipes)
+from api import bulk
 from api.paginators import FoodPageLimitPaginator
-
-from .serializers import (TagSerializer, IngredientSerializer,
+from api.conditional import make_etag, recipes_version, viewer_state
+from api.feed import (backfill_feed, fan_out_recipe, feed_queryset,
+                      remove_from_feed)
+from api.ingredient_index import ingredient_index
+from api.renderers import PlainTextRenderer, CSVRenderer
+from api.search import search_recipes
+from api.tag_cache import tag_cache
+from api.shopping_list import (SHOPPING_LIST_FORMATS, shopping_list_etag,
+                               shopping_list_rows)
+
+from .serializers import (BulkIdsSerializer, TagSerializer,
+                          IngredientSerializer,
                           RecipeReadSerializer, RecipeWriteSerializer,
                           ShortRecipeSerializer, SubsciptionReadSerializer)
-from .filters import IngredientFilter
+from .filters import IngredientFilter, filter_by_tags
 
 
 class TokenCreateView(utils.ActionViewMixin, generics.GenericAPIView):
     """
-    Переписали djoser-овский вью-класс для отображения корректного статус-кода
+    Переписали djoser-овский вью-класс для отображения корректного статус-кода.
+    При AUTH_TOKEN_TYPE = 'jwt' выдается подписанный access-токен
+    вместо токена из базы.
     """
 
     serializer_class = settings.SERIALIZERS.token_create
@@ -32,6 +53,14 @@ class TokenCreateView(utils.ActionViewMixin, generics.GenericAPIView):
     pagination_class = FoodPageLimitPaginator
 
     def _action(self, serializer):
+        if django_settings.AUTH_TOKEN_TYPE == 'jwt':
+            user_logged_in.send(sender=serializer.user.__class__,
+                                request=self.request, user=serializer.user)
+            return Response(
+                data={'auth_token': str(
+                    AccessToken.for_user(serializer.user))},
+                status=status.HTTP_201_CREATED
+            )
         token = utils.login_user(self.request, serializer.user)
         token_serializer_class = settings.SERIALIZERS.token
         return Response(
@@ -40,30 +69,81 @@ class TokenCreateView(utils.ActionViewMixin, generics.GenericAPIView):
         )
 
 
+def bulk_response(request, operation):
+    """
+    Применяет массовую операцию к списку ids из тела запроса
+    и возвращает статус по каждому id в исходном порядке.
+    """
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    statuses = operation(request.user, ids)
+    return Response({'results': [{'id': pk, 'status': statuses[pk]}
+                                 for pk in ids]})
+
+
 class FoodUserView(UserViewSet):
     permission_classes = [permissions.AllowAny]
 
-    @action(detail=False, methods=['get'])
+    def get_subscriptions_queryset(self):
+        """
+        Авторы с не более чем recipes_limit последними рецептами каждого
+        автора: один запрос на страницу авторов и один prefetch-запрос
+        с оконной функцией на рецепты.
+        """
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.annotate(row_number=Window(
+                RowNumber(), partition_by=F('author'), order_by=F('pk').desc()
+            )).filter(row_number__lte=int(recipes_limit))
+
+        return FoodUser.objects.prefetch_related(
+            Prefetch('recipes', queryset=recipes))
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
     def subscriptions(self, request):
-        recipes_limit = int(self.request.query_params.get('recipes_limit'))
+        queryset = self.paginate_queryset(
+            self.get_subscriptions_queryset().filter(
+                subscription__user=self.request.user))
+        serializer = SubsciptionReadSerializer(queryset, many=True)
+        return self.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+        """
         queryset = self.paginate_queryset(
-            FoodUser.objects.filter(subscription__user=self.request.user))
-        serializer = SubsciptionReadSerializer(
-            queryset,
-            context={'recipes_limit': recipes_limit},
-            many=True)
+            feed_queryset(get_recipe_queryset(request.user), request.user))
+        serializer = RecipeReadSerializer(
+            queryset, many=True, context=self.get_serializer_context())
         return self.get_paginated_response(serializer.data)
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='subscribe', url_name='subscribe-bulk',
+            permission_classes=[permissions.IsAuthenticated])
+    def subscribe_bulk(self, request):
+        """
+        Подписка на несколько авторов или отписка от них.
+        """
+        if request.method == 'POST':
+            return bulk_response(request, bulk.subscriptions.add)
+        return bulk_response(request, bulk.subscriptions.remove)
+
     @action(detail=True, methods=['post', 'delete'])
     def subscribe(self, request, **kwargs):
-        subscription = get_object_or_404(FoodUser, id=kwargs['id'])
+        subscription = get_object_or_404(self.get_subscriptions_queryset(),
+                                         id=kwargs['id'])
 
         if request.method == 'POST':
             Subscription.objects.create(
                 user=request.user,
                 subscription=subscription
             )
+            backfill_feed(request.user, subscription)
             return Response(
                 SubsciptionReadSerializer(subscription).data,
                 status=status.HTTP_201_CREATED)
@@ -73,23 +153,44 @@ class FoodUserView(UserViewSet):
                 user=request.user,
                 subscription=subscription
             ).delete()
-            return Response({'detail': 'Успешная отписка'},
-                            status=status.HTTP_204_NO_CONTENT)
+            remove_from_feed(request.user, subscription)
+            return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    API эндпоинт для просмотра списка тегов или тега по id
+    API эндпоинт для просмотра списка тегов или тега по id.
+    Теги отдаются из кеша каталога тегов.
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        etag = make_etag('tags', tag_cache.version())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(tag_cache.all(), headers={'ETag': etag})
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        etag = make_etag('tag', pk, tag_cache.version())
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        tag = tag_cache.get(int(pk)) if pk.isdigit() else None
+        if tag is None:
+            raise NotFound
+        return Response(tag, headers={'ETag': etag})
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    API эндпоинт для просмотра списка ингредиентов или тега по ингредиенту
+    API эндпоинт для просмотра списка ингредиентов или тега по ингредиенту.
+    Поиск по началу имени обслуживается префиксным индексом без
+    обращения к базе данных.
     """
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -97,6 +198,70 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
+
+
+def get_recipe_queryset(user):
+    """
+    Рецепты для вывода через RecipeReadSerializer: только поля,
+    нужные для ключей кеша фрагментов, и флаги избранного и списка
+    покупок пользователя. Остальное сериализатор берет из кеша.
+    """
+    queryset = Recipe.objects.only('id', 'author', 'modified')
+
+    if user.is_authenticated:
+        queryset = queryset.annotate(
+            is_favorited=Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCartRecipes.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+    return queryset
+
+
+def filter_recipes(user, params):
+    """
+    Рецепты для списка и детальной страницы с фильтрами
+    из query-параметров params.
+    """
+    queryset = get_recipe_queryset(user)
+
+    search = params.get('search')
+    if search:
+        if FoodPageLimitPaginator.cursor_query_param in params:
+            # Курсор строится по id и потерял бы сортировку по релевантности.
+            raise ValidationError({
+                FoodPageLimitPaginator.cursor_query_param: [
+                    'Нельзя использовать вместе с search.']})
+        queryset = search_recipes(queryset, search)
+
+    tags = params.getlist('tags')
+    if tags:
+        queryset = filter_by_tags(
+            queryset, tags, match_all=params.get('tags_mode') == 'all')
+
+    author = params.get('author')
+    if author:
+        queryset = queryset.filter(author=author)
+
+    is_favorited = params.get('is_favorited')
+    if is_favorited:
+        if user.is_anonymous:
+            return queryset.none()
+        queryset = queryset.filter(is_favorited=True)
+
+    is_in_shopping_cart = params.get('is_in_shopping_cart')
+    if is_in_shopping_cart:
+        if user.is_anonymous:
+            return queryset.none()
+        queryset = queryset.filter(is_in_shopping_cart=True)
+
+    return queryset
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
     """
@@ -107,38 +272,56 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         author = get_object_or_404(FoodUser, id=self.request.user.id)
-        serializer.save(author=author)
+        recipe = serializer.save(author=author)
+        fan_out_recipe(recipe)
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
-    def get_queryset(self):
-        queryset = Recipe.objects.prefetch_related(
-            'recipe_ingredient__ingredient', 'tags'
-        ).all()
-
-        tags = self.request.query_params.getlist('tags')
-        if tags:
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
-
-        author = self.request.query_params.get('author')
-        if author:
-            queryset = queryset.filter(author=author)
-
-        is_favorited = self.request.query_params.get('is_favorited')
-        if is_favorited:
-            queryset = queryset.filter(
-                recipe_in_favorite__user=self.request.user)
+    def list(self, request, *args, **kwargs):
+        """
+        ETag списка строится по версии выдачи рецептов, версии тегов
+        и состоянию избранного, списка покупок и подписок пользователя.
+        """
+        etag = make_etag('recipes', request.get_full_path(),
+                         recipes_version(), tag_cache.version(),
+                         *viewer_state(request.user))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+            response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not kwargs['pk'].isdigit():
+            raise NotFound
+        modified = Recipe.objects.filter(
+            pk=kwargs['pk']).values_list('modified', flat=True).first()
+        if modified is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag = make_etag('recipe', kwargs['pk'], modified,
+                         tag_cache.version(), *viewer_state(request.user))
+        # Флаги пользователя не отражаются в modified, поэтому
+        # Last-Modified отдается только анонимным пользователям.
+        last_modified = None
+        if request.user.is_anonymous:
+            last_modified = int(modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
 
-        is_in_shopping_cart = self.request.query_params.get(
-            'is_in_shopping_cart')
-        if is_in_shopping_cart:
-            queryset = queryset.filter(
-                recipe_in_cart__user=self.request.user)
-
-        return queryset
+    def get_queryset(self):
+        if self.action not in ('list', 'retrieve'):
+            return super().get_queryset()
+        return filter_recipes(self.request.user, self.request.query_params)
 
 
 class FavoriteViewSet(APIView):
@@ -153,22 +336,24 @@ class FavoriteViewSet(APIView):
             user=request.user,
             recipe=recipe
         ).delete()
-        return Response({'detail': 'Рецепт успешно удален из избранного'},
-                        status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def post(self, request, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['id'])
-        FavoriteRecipe.objects.create(
+        _, created = FavoriteRecipe.objects.get_or_create(
             user=request.user,
             recipe=recipe
         )
+        if not created:
+            return Response({'detail': 'Рецепт уже в избранном'},
+                            status=status.HTTP_400_BAD_REQUEST)
         return Response(ShortRecipeSerializer(recipe).data,
                         status=status.HTTP_201_CREATED)
 
 
 class ShoppingCartViewSet(APIView):
     """
-    API эндпоинт для get, post и del запросов по списку покупок.
+    API эндпоинт для post и del запросов по списку покупок.
     """
     def delete(self, request, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['id'])
@@ -176,34 +361,65 @@ class ShoppingCartViewSet(APIView):
             user=request.user,
             recipe=recipe
         ).delete()
-        return Response(
-            {'detail': 'Рецепт успешно удален из списка покупок'},
-            status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     def post(self, request, **kwargs):
         recipe = get_object_or_404(Recipe, id=kwargs['id'])
-        ShoppingCartRecipes.objects.create(
+        _, created = ShoppingCartRecipes.objects.get_or_create(
             user=request.user,
             recipe=recipe
         )
+        if not created:
+            return Response({'detail': 'Рецепт уже в списке покупок'},
+                            status=status.HTTP_400_BAD_REQUEST)
         return Response(ShortRecipeSerializer(recipe).data,
                         status=status.HTTP_201_CREATED)
 
+
+class BulkLinkView(APIView):
+    """
+    API эндпоинт для массового добавления (post) и удаления (delete)
+    рецептов по списку id.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    links = None
+
+    def post(self, request):
+        return bulk_response(request, self.links.add)
+
+    def delete(self, request):
+        return bulk_response(request, self.links.remove)
+
+
+class BulkFavoriteView(BulkLinkView):
+    links = bulk.favorites
+
+
+class BulkShoppingCartView(BulkLinkView):
+    links = bulk.shopping_cart
+
+
+class DownloadShoppingCartView(APIView):
+    """
+    API эндпоинт для выгрузки списка покупок в форматах txt, csv и json.
+    Список отдается потоком, повторная выгрузка неизменившегося списка
+    с If-None-Match получает 304.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [PlainTextRenderer, CSVRenderer, JSONRenderer]
+
     def get(self, request):
-        shopping_list = ['Ваш список покупок:', '\n-------------------']
-
-        for obj in (IngredientRecipe.objects.filter(
-            recipe__recipe_in_cart__user=request.user)
-            .values('ingredient').annotate(Sum('amount'))
-            .values_list('ingredient__name',
-                         'ingredient__measurement_unit',
-                         'amount__sum')):
-            shopping_list.append(f'\n{obj[0]} ({obj[1]}) - {obj[2]}')
-        shopping_list.append('\n-------------------\nПриятных покупок!')
-
-        return HttpResponse(
-            shopping_list,
-            headers={
-                "Content-Type": "text/plain",
-                "Content-Disposition": 'attachment; filename="sh_list.txt"'}
-        )
+        list_format = request.query_params.get('format', 'txt')
+        etag = shopping_list_etag(request.user, list_format)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        shopping_list_format = SHOPPING_LIST_FORMATS[list_format]
+        response = StreamingHttpResponse(
+            shopping_list_format.render(shopping_list_rows(request.user)),
+            content_type=shopping_list_format.content_type)
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename="sh_list.{list_format}"')
+        return response
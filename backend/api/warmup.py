@@ -0,0 +1,144 @@
+import importlib
+import inspect
+import sys
+import time
+from contextlib import contextmanager
+
+IMPORT_PHASES = (
+    ('django', ('django.db.models', 'django.http', 'django.contrib.admin')),
+    ('rest_framework', ('rest_framework.serializers',
+                        'rest_framework.response')),
+    ('psycopg', ('psycopg',)),
+    ('Pillow', ('PIL.Image',)),
+    ('webcolors', ('webcolors',)),
+)
+
+
+class StartupReport:
+    """
+    Время фаз запуска процесса и число импортированных в каждой
+    фазе модулей. Исключения из errors не прерывают запуск,
+    а записываются в failures под именем фазы.
+    """
+    def __init__(self):
+        self.phases = []
+        self.failures = {}
+
+    @contextmanager
+    def phase(self, name, errors=()):
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        except errors as error:
+            self.failures[name] = error
+        finally:
+            self.phases.append((name, time.perf_counter() - start,
+                                len(sys.modules) - modules))
+
+    def total(self):
+        return sum(duration for _, duration, _ in self.phases)
+
+    def format(self):
+        lines = [f'Запуск за {self.total() * 1000:.1f} мс:']
+        for name, duration, modules in self.phases:
+            line = (f'  {name:<24} {duration * 1000:8.1f} мс  '
+                    f'{modules:5d} модулей')
+            if name in self.failures:
+                line += f'  ошибка: {self.failures[name]}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+
+def import_packages(report):
+    """
+    Импортирует тяжелые зависимости по одной, чтобы отчет показывал
+    время импорта каждой. Здесь только модули, которым не нужен
+    загруженный реестр приложений, остальное импортирует django.setup().
+    """
+    for name, modules in IMPORT_PHASES:
+        with report.phase(f'import {name}'):
+            for module in modules:
+                importlib.import_module(module)
+
+
+def load_application(report, module):
+    """
+    Импортирует модуль приложения (backend.wsgi или backend.asgi),
+    который выполняет django.setup().
+    """
+    with report.phase(f'import {module}'):
+        importlib.import_module(module)
+
+
+def warm_up(report):
+    """
+    Выполняет то, что иначе случилось бы при первых запросах воркера:
+    разбор urlconf и импорт view, загрузку переводов, построение полей
+    сериализаторов, загрузку каталогов тегов и ингредиентов.
+    Если база еще недоступна, каталоги загрузят воркеры при первых
+    запросах, а ошибка попадет в отчет.
+    """
+    from django.conf import settings
+    from django.db import DatabaseError
+    from django.urls import get_resolver
+    from django.utils import translation
+    from rest_framework.serializers import ListSerializer, Serializer
+
+    from . import serializers
+    from .ingredient_index import ingredient_index
+    from .tag_cache import tag_cache
+
+    with report.phase('urlconf'):
+        get_resolver().reverse_dict
+    with report.phase('translations'):
+        translation.activate(settings.LANGUAGE_CODE)
+        translation.gettext('Not found.')
+    with report.phase('serializers'):
+        for serializer_class in vars(serializers).values():
+            if (inspect.isclass(serializer_class)
+                    and issubclass(serializer_class, Serializer)
+                    and not issubclass(serializer_class, ListSerializer)):
+                serializer_class().fields
+    with report.phase('tags', errors=DatabaseError):
+        tag_cache.all()
+    if 'tags' in report.failures:
+        return
+    with report.phase('ingredient index', errors=(DatabaseError, OSError)):
+        ingredient_index.prime()
+
+
+def preload(module):
+    """
+    Загрузка и прогрев приложения в мастер-процессе до форка воркеров.
+    Соединения с базой и пулы закрываются, чтобы воркеры не унаследовали
+    общие сокеты.
+    """
+    report = StartupReport()
+    import_packages(report)
+    load_application(report, module)
+    warm_up(report)
+
+    from django.db import connections
+
+    for connection in connections.all():
+        if hasattr(connection, 'close_pool'):
+            connection.close_pool()
+    connections.close_all()
+    return report
+
+
+def open_connections():
+    """
+    Открывает соединения воркера сразу после форка: пул соединений
+    или соединение, переживающее запрос (CONN_MAX_AGE), чтобы первый
+    запрос не ждал подключения к базе.
+    """
+    from django.db import connections
+
+    for connection in connections.all():
+        pool = getattr(connection, 'pool', None)
+        if pool is not None:
+            pool.open()
+        elif connection.settings_dict['CONN_MAX_AGE'] != 0:
+            connection.ensure_connection()
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Under ASGI the hot read endpoints are served by async views
+# (api/async_views.py); set DJANGO_ROOT_URLCONF=backend.urls to disable.
+os.environ.setdefault('DJANGO_ROOT_URLCONF', 'backend.urls_async')
 
 application = get_asgi_application()
@@ -0,0 +1,137 @@
+"""
+Бэкенд PostgreSQL с пулом соединений psycopg_pool в каждом процессе.
+
+Настраивается как пул в Django 5.1: OPTIONS['pool'] равно True или
+словарю аргументов psycopg_pool.ConnectionPool (min_size, max_size,
+timeout, max_idle, max_lifetime, ...). Без него бэкенд работает как
+django.db.backends.postgresql. С CONN_HEALTH_CHECKS соединение
+проверяется при каждой выдаче из пула.
+"""
+import os
+import threading
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg_pool import ConnectionPool, PoolTimeout
+
+from api.metrics import registry
+
+from .creation import DatabaseCreation
+
+NO_DB_ALIAS = '__no_db__'
+
+_pools = {}
+_pools_lock = threading.Lock()
+# Пулы, унаследованные при fork. Их сокеты общие с родительским процессом,
+# поэтому в дочернем процессе они не используются и не закрываются, а ссылки
+# на них хранятся, чтобы их не закрыл и сборщик мусора.
+_inherited_pools = []
+
+
+def _forget_pools():
+    _inherited_pools.extend(_pools.values())
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+def pool_gauges():
+    for alias, (_, pool) in list(_pools.items()):
+        stats = pool.get_stats()
+        labels = (('alias', alias),)
+        yield ('foodgram_db_pool_size', labels), stats['pool_size']
+        yield ('foodgram_db_pool_available', labels), stats['pool_available']
+        yield (('foodgram_db_pool_waiting', labels),
+               stats.get('requests_waiting', 0))
+
+
+registry.add_gauges(pool_gauges)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict['OPTIONS'].get('pool')
+        if self.alias == NO_DB_ALIAS or not pool_options:
+            return None
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(
+                'Pooled connections require CONN_MAX_AGE = 0.')
+
+        name = self.settings_dict['NAME']
+        entry = _pools.get(self.alias)
+        if entry is not None and entry[0] == name:
+            return entry[1]
+        with _pools_lock:
+            entry = _pools.get(self.alias)
+            if entry is not None and entry[0] == name:
+                return entry[1]
+            if entry is not None:
+                # Сменилась NAME, например тесты перешли на тестовую базу.
+                entry[1].close()
+            if pool_options is True:
+                pool_options = {}
+            connect_kwargs = self.get_connection_params()
+            # Нужный режим autocommit Django выставит после выдачи.
+            connect_kwargs['autocommit'] = True
+            check = None
+            if self.settings_dict['CONN_HEALTH_CHECKS']:
+                check = ConnectionPool.check_connection
+            pool = ConnectionPool(
+                kwargs=connect_kwargs, open=False, check=check,
+                name=self.alias, **pool_options)
+            _pools[self.alias] = (name, pool)
+            return pool
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = base.IsolationLevel(options.get(
+            'isolation_level', base.IsolationLevel.READ_COMMITTED))
+        pool.open()
+        labels = (('alias', self.alias),)
+        start = time.perf_counter()
+        try:
+            connection = pool.getconn()
+        except PoolTimeout:
+            registry.inc('foodgram_db_pool_timeouts_total', labels)
+            raise
+        finally:
+            registry.observe('foodgram_db_pool_wait_seconds', labels,
+                             time.perf_counter() - start)
+        if 'isolation_level' in options:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        # Соединение возвращается в пул, из которого выдано: это может
+        # быть прежний пул алиаса.
+        pool = getattr(self.connection, '_pool', None)
+        if pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+            self.connection = None
+
+    def close_pool(self):
+        """
+        Закрывает пул алиаса, например в мастер-процессе gunicorn
+        перед форком воркеров.
+        """
+        self.close()
+        with _pools_lock:
+            entry = _pools.pop(self.alias, None)
+        if entry is not None:
+            entry[1].close()
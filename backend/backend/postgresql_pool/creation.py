@@ -0,0 +1,9 @@
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Соединения пула не дают удалить тестовую базу.
+        self.connection.close_pool()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import os
+import tempfile
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -53,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,7 +66,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'backend.urls'
+ROOT_URLCONF = os.getenv('DJANGO_ROOT_URLCONF', 'backend.urls')
 
 TEMPLATES = [
     {
@@ -86,17 +90,86 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# backend.postgresql_pool keeps a psycopg_pool pool of connections in every
+# worker process (DB_POOL=False switches back to a connection per request).
+# Each request checks a connection out of the pool and returns it when it
+# finishes, so CONN_MAX_AGE stays 0. With CONN_HEALTH_CHECKS a connection is
+# checked with a round trip when it leaves the pool.
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'backend.postgresql_pool',
         'NAME': os.getenv('POSTGRES_DB', 'foodgram_base'),
         'USER': os.getenv('POSTGRES_USER', 'foodgram_user'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_POOL_HEALTH_CHECKS', 'True') == 'True',
+        'OPTIONS': {},
     }
 }
 
+if os.getenv('DB_POOL', 'True') == 'True':
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 1)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 4)),
+        # Seconds to wait for a free connection before failing the request.
+        'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        # Idle connections above min_size are closed after max_idle seconds.
+        'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+        'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+    }
+
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds the aliases replica_1,
+# replica_2, ... with the credentials of the primary. api.replicas routes the
+# reads of safe requests there. A client that has written something reads
+# from the primary for REPLICA_PIN_SECONDS, which must exceed the usual
+# replication lag. Pointing DB_REPLICA_HOSTS at the primary host is enough
+# to try the routing locally. In tests the replicas mirror default.
+
+DB_REPLICA_HOSTS = [host for host in os.getenv(
+    'DB_REPLICA_HOSTS', '').split(',') if host]
+for number, host in enumerate(DB_REPLICA_HOSTS, start=1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# The default file-based cache is shared by all workers of a container, so
+# version keys bumped by one worker are seen by the others.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    },
+    # Rendered recipe fragments. Keys are versioned by Recipe.modified, so a
+    # per-process cache is safe; point it at memcached/redis to share it.
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('RECIPE_CACHE_LOCATION', 'recipes'),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+RECIPE_FRAGMENT_CACHE = 'recipes'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -150,11 +223,26 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.StatelessTokenAuthentication',
+        'api.authentication.TokenAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.FoodPageLimitPaginator',
 }
 
+# Login issues database tokens by default; AUTH_TOKEN_TYPE=jwt switches it to
+# short-lived signed access tokens that are verified without a DB lookup.
+# Both kinds of tokens are accepted in either mode. Unsafe requests with a
+# signed token check that the user exists and is active; safe requests skip
+# the lookup, so they keep working until the token expires
+# (JWT_ACCESS_TOKEN_MINUTES).
+AUTH_TOKEN_TYPE = os.getenv('AUTH_TOKEN_TYPE', 'token')
+
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(
+        minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', 15))),
+    'AUTH_HEADER_TYPES': ('Token', 'Bearer'),
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
@@ -172,3 +260,30 @@ EMAIL_LENGTH = 254
 NAME_LENGTH = 150
 CHARFIELD_LENGTH = 200
 COLOR_LENGHT = 50
+
+# Memory-mapped ingredient prefix index shared by all workers
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH',
+    os.path.join(tempfile.gettempdir(), 'foodgram_ingredients.idx'))
+# Seconds a process trusts the catalog version it read from the cache
+INGREDIENT_INDEX_VERSION_TTL = float(
+    os.getenv('INGREDIENT_INDEX_VERSION_TTL', 5))
+
+# Recipe image variants generated in a background thread pool
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Subscription feed: authors with more followers are merged at read time
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+FEED_BACKFILL = 50
+
+# Largest id list accepted by the bulk favorite/cart/subscribe endpoints
+BULK_MAX_IDS = 1000
+
+# Per-view latency/SQL metrics. Every worker dumps its counters into
+# METRICS_DIR, and the scrape endpoint sums all the dumps.
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics'))
+METRICS_DUMP_INTERVAL = 5
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
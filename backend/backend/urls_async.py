@@ -0,0 +1,20 @@
+from django.urls import path, include
+
+from api import async_views
+
+
+urlpatterns = [
+    path('api/recipes/', async_views.recipe_list, name='recipe-list'),
+    path('api/recipes/<int:pk>/', async_views.recipe_detail,
+         name='recipe-detail'),
+    path('api/recipes/download_shopping_cart/',
+         async_views.download_shopping_cart,
+         name='download'),
+    path('api/ingredients/', async_views.ingredient_list,
+         name='ingredient-list'),
+    path('api/ingredients/<int:pk>/', async_views.ingredient_detail,
+         name='ingredient-detail'),
+    path('api/tags/', async_views.tag_list, name='tag-list'),
+    path('api/tags/<int:pk>/', async_views.tag_detail, name='tag-detail'),
+    path('', include('backend.urls')),
+]
@@ -0,0 +1,24 @@
+import os
+
+from api import warmup
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS',
+                         'uvicorn.workers.UvicornWorker')
+
+# The application is loaded and warmed up in when_ready, which runs in the
+# master after the listeners are bound and before the workers fork, so
+# workers inherit the imported modules and primed caches. preload_app stays
+# off: it would import the application before any hook could time it.
+preload_app = False
+
+
+def when_ready(server):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    report = warmup.preload(server.app.app_uri.split(':')[0])
+    server.log.info(report.format())
+
+
+def post_fork(server, worker):
+    warmup.open_connections()
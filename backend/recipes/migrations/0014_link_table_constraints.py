@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_links(apps, schema_editor):
+    for model_name in ('FavoriteRecipe', 'ShoppingCartRecipes'):
+        model = apps.get_model('recipes', model_name)
+        duplicates = (model.objects.values('user', 'recipe')
+                      .annotate(keep=Min('id'), count=Count('id'))
+                      .filter(count__gt=1))
+        for duplicate in duplicates:
+            model.objects.filter(
+                user=duplicate['user'], recipe=duplicate['recipe']
+            ).exclude(id=duplicate['keep']).delete()
+
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = (IngredientRecipe.objects.values('recipe', 'ingredient')
+                  .annotate(keep=Min('id'), count=Count('id'),
+                            total=Sum('amount'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        IngredientRecipe.objects.filter(
+            recipe=duplicate['recipe'], ingredient=duplicate['ingredient']
+        ).exclude(id=duplicate['keep']).delete()
+        IngredientRecipe.objects.filter(id=duplicate['keep']).update(
+            amount=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_links,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favoriterecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingredientrecipe',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), include=('amount',), name='unique_recipe_ingredient'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartrecipes',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    FoodUser = apps.get_model('users', 'FoodUser')
+    Subscription = apps.get_model('users', 'Subscription')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedRecipe = apps.get_model('recipes', 'FeedRecipe')
+
+    FoodUser.objects.update(followers_count=Coalesce(Subquery(
+        Subscription.objects.filter(subscription=OuterRef('pk'))
+        .order_by().values('subscription')
+        .annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()
+    ), 0))
+
+    for subscription in Subscription.objects.filter(
+            subscription__followers_count__lte=settings.FEED_FANOUT_LIMIT):
+        recipes = Recipe.objects.filter(
+            author=subscription.subscription_id
+        ).order_by('-pk').values_list('pk', flat=True)[
+            :settings.FEED_BACKFILL]
+        FeedRecipe.objects.bulk_create(
+            [FeedRecipe(user_id=subscription.user_id, recipe_id=recipe_id)
+             for recipe_id in recipes],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('users', '0006_fooduser_followers_count'),
+        ('recipes', '0016_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='in_feeds', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='feedrecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
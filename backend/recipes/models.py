@@ -1,3 +1,5 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.core.validators import MinValueValidator
 
@@ -23,6 +25,12 @@ class Ingredient(models.Model):
 
     class Meta:
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -39,16 +47,26 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         null=True,
         default=None)
+    image_variants = models.JSONField(default=dict, editable=False)
     name = models.CharField(max_length=CHARFIELD_LENGTH)
     text = models.TextField()
     cooking_time = models.IntegerField(
         validators=[MinValueValidator(1)])
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
+    modified = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:
         return self.name
 
     class Meta:
         ordering = ['-pk']
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+            GinIndex(fields=['search_vector'],
+                     name='recipe_search_vector_gin'),
+        ]
 
 
 class IngredientRecipe(models.Model):
@@ -59,6 +77,15 @@ class IngredientRecipe(models.Model):
                                related_name='recipe_ingredient')
     amount = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                include=['amount'],
+                name='unique_recipe_ingredient'
+            )
+        ]
+
     def __str__(self) -> str:
         return f'{self.ingredient} {self.recipe}'
 
@@ -72,6 +99,14 @@ class FavoriteRecipe(models.Model):
                                on_delete=models.CASCADE,
                                related_name='recipe_in_favorite')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_favorite'
+            )
+        ]
+
     def __str__(self) -> str:
         return f'{self.user} prefers {self.recipe}'
 
@@ -85,5 +120,38 @@ class ShoppingCartRecipes(models.Model):
                                on_delete=models.CASCADE,
                                related_name='recipe_in_cart')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_shopping_cart'
+            )
+        ]
+
     def __str__(self) -> str:
         return f'{self.user} put {self.recipe} in shopping cart'
+
+
+class FeedRecipe(models.Model):
+    """
+    Рецепт в ленте подписчика. Заполняется при публикации рецепта
+    автором, у которого не больше FEED_FANOUT_LIMIT подписчиков.
+    """
+    user = models.ForeignKey(FoodUser,
+                             on_delete=models.CASCADE,
+                             related_name='feed')
+
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='in_feeds')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_recipe'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe} in feed of {self.user}'
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_fooduser_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooduser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.4 on 2026-10-18 20:56
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_fooduser_followers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenUser',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('users.fooduser',),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.4 on 2026-10-18 21:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_tokenuser'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='TokenUser',
+        ),
+    ]
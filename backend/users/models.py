@@ -33,6 +33,8 @@ class FoodUser(AbstractUser):
         max_length=NAME_LENGTH,
         verbose_name='last name'
     )
+    recipes_count = models.PositiveIntegerField(default=0, editable=False)
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
@@ -45,6 +47,16 @@ class FoodUser(AbstractUser):
     def __str__(self):
         return self.email
 
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Обращение к отложенному полю загружает сразу все отложенные поля:
+        пользователь из подписанного токена содержит только id.
+        """
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields)
+
 
 class Subscription(models.Model):
     user = models.ForeignKey(